@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BENCH_CHAT_ID = -1001000000001
+os.environ.setdefault("ALLOWED_CHAT_IDS", str(BENCH_CHAT_ID))
+
+BOT_USER = {"id": 1000001, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+BOT_TOKEN = "1000001:BENCH"
+UNLIMITED = 10 ** 9
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+def chat(chat_id: int) -> dict:
+    if chat_id < 0:
+        return {"id": chat_id, "type": "supergroup", "title": "Bench"}
+    return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+
+
+def message_update(update_id: int, chat_id: int, user_id: int, text: str, reply_to: int = None) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": chat(chat_id),
+        "from": user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if reply_to is not None:
+        message["reply_to_message"] = {
+            "message_id": reply_to,
+            "date": int(time.time()),
+            "chat": chat(chat_id),
+            "from": BOT_USER,
+            "text": "game",
+        }
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id: int, chat_id: int, user_id: int, message_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": chat(chat_id),
+                "from": BOT_USER,
+                "text": "game",
+            },
+        },
+    }
+
+
+class FakeBotAPI(BaseRequest):
+    """Bot API в памяти процесса: отвечает как Telegram, записывает все вызовы,
+    getUpdates отдает обновления из push_update с long polling"""
+
+    def __init__(self, rtt: float = 0.0, jitter: float = 0.0):
+        self.rtt = rtt
+        self.jitter = jitter
+        self.calls: List[Tuple[float, str, dict]] = []
+        self.listeners: List[Callable[[str, dict], None]] = []
+        self._updates: List[dict] = []
+        self._updates_event: Optional[asyncio.Event] = None
+        self._message_ids = itertools.count(100000)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def push_update(self, update: dict) -> None:
+        self._updates.append(update)
+        if self._updates_event:
+            self._updates_event.set()
+
+    def calls_by_method(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for _, endpoint, _ in self.calls:
+            counts[endpoint] = counts.get(endpoint, 0) + 1
+        return counts
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData = None,
+        read_timeout: float = None,
+        write_timeout: float = None,
+        connect_timeout: float = None,
+        pool_timeout: float = None,
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+
+        if endpoint == "getUpdates":
+            result = await self._get_updates(params)
+        elif endpoint == "getMe":
+            # у нескольких ботов на одном фейковом API id берется из токена, как в Telegram
+            result = dict(BOT_USER, id=int(url.rsplit("/bot", 1)[-1].split(":")[0]))
+        else:
+            if self.rtt or self.jitter:
+                await asyncio.sleep(self.rtt + random.random() * self.jitter)
+            result = self._respond(endpoint, params)
+            self.calls.append((time.perf_counter(), endpoint, params))
+            for listener in self.listeners:
+                listener(endpoint, params)
+
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = params.get("offset") or 0
+        timeout = params.get("timeout") or 0
+        if self._updates_event is None:
+            self._updates_event = asyncio.Event()
+
+        pending = [update for update in self._updates if update["update_id"] >= offset]
+        if not pending and timeout:
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            pending = [update for update in self._updates if update["update_id"] >= offset]
+
+        self._updates = pending
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        return pending[: params.get("limit") or 100]
+
+    def _respond(self, endpoint: str, params: dict):
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint in ("sendMessage", "editMessageText"):
+            chat_id = params.get("chat_id", BENCH_CHAT_ID)
+            return {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": chat(chat_id),
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+
+def make_builder(api: FakeBotAPI, db_path: str = None, updates_api: FakeBotAPI = None):
+    """ApplicationBuilder как в main.py, но с фейковым Bot API, временной базой
+    и лимитером без ограничений, чтобы мерить сам бот"""
+    from telegram.ext import ApplicationBuilder
+
+    from core.chats import LazyChatsApplication
+    from core.outbound import OutboundLimiter
+    from core.persistence import SQLitePersistence
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "chats_data.sqlite3")
+    return (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(api)
+        .get_updates_request(updates_api or api)
+        .persistence(SQLitePersistence(filepath=db_path, update_interval=60))
+        .application_class(LazyChatsApplication)
+        .rate_limiter(
+            OutboundLimiter(
+                overall_max_rate=UNLIMITED,
+                group_max_rate=UNLIMITED,
+                group_time_period=1,
+                private_max_rate=UNLIMITED,
+            )
+        )
+    )
@@ -0,0 +1,86 @@
+"""Проверка записи нагрузки на полной цепочке запросов main.py: с METRICS_PORT и
+RECORD_UPDATES одновременно (InstrumentedRequest поверх RecordingRequest).
+Короткая сессия (/new и нажатия кнопок) пишется в лог, затем воспроизводится:
+id списка игры должен попасть в запись, а нажатия при воспроизведении - найти игру.
+
+    python -m bench.record_roundtrip
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+directory = tempfile.mkdtemp(prefix="bench-record-")
+# до импорта main: настройки читаются из env при импорте
+os.environ["RECORD_UPDATES"] = os.path.join(directory, "updates.jsonl.gz")
+# сервер метрик не поднимается (post_init не вызывается), нужна только обертка запросов
+os.environ["METRICS_PORT"] = "9"
+os.environ["DB_PATH"] = os.path.join(directory, "chats.sqlite3")
+
+from telegram import Update  # noqa: E402
+
+from bench.fake_api import BENCH_CHAT_ID, BOT_TOKEN, FakeBotAPI, callback_update, message_update  # noqa: E402
+from bench.replay import replay  # noqa: E402
+from core.metrics import InstrumentedRequest  # noqa: E402
+from core.recorder import RECORDER, RecordingRequest  # noqa: E402
+from core.tenants import DEFAULT  # noqa: E402
+
+PRESSES = ("i", "i+1", "i+1", "not_sure", "i", "i-1")
+
+
+async def record() -> int:
+    from main import bot_builder, build_application
+
+    DEFAULT.token = BOT_TOKEN
+    builder = bot_builder(request=FakeBotAPI()).updater(None)
+    application = build_application(builder)
+    if not isinstance(application.bot.request, InstrumentedRequest) or not isinstance(
+        application.bot.request.request, RecordingRequest
+    ):
+        raise SystemExit(f"Unexpected request chain: {application.bot.request!r}")
+
+    await application.initialize()
+    RECORDER.bot_id = application.bot.id
+    await application.start()
+    await application.process_update(
+        Update.de_json(message_update(1, BENCH_CHAT_ID, 1, "/new 10.10.2099 #запись"), application.bot)
+    )
+    message_id = next(key for key in application.chat_data[BENCH_CHAT_ID] if isinstance(key, int))
+    for update_id, data in enumerate(PRESSES, start=2):
+        await application.process_update(
+            Update.de_json(callback_update(update_id, BENCH_CHAT_ID, 100 + update_id, message_id, data), application.bot)
+        )
+    roster = len(application.chat_data[BENCH_CHAT_ID][message_id])
+    await application.stop()
+    # отложенные правки списков и файл записи, как при остановке бота
+    await application.post_stop(application)
+    await application.shutdown()
+    return roster
+
+
+def main() -> int:
+    logging.getLogger().setLevel(logging.WARNING)
+    roster = asyncio.run(record())
+    stats = RECORDER.stats()
+    results = asyncio.run(replay([os.environ["RECORD_UPDATES"]], speed=0, concurrency=0))
+
+    errors = []
+    if stats["sent"] != 1:
+        errors.append(f"recorded {stats['sent']} game posts, expected 1")
+    if stats["recorded"] != 1 + len(PRESSES):
+        errors.append(f"recorded {stats['recorded']} updates, expected {1 + len(PRESSES)}")
+    if results["unmatched_game_posts"]:
+        errors.append(f"{results['unmatched_game_posts']} game posts not found in the recording")
+    if results["games"] != 1:
+        errors.append(f"replay left {results['games']} games, expected 1")
+    if results["api_calls"].get("editMessageText", 0) == 0:
+        errors.append("replayed presses did not edit the game")
+    for error in errors:
+        print(error)
+    print(f"recorded {stats}, roster {roster}, replay {results['updates']} updates, {len(errors)} errors")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
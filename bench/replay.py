@@ -0,0 +1,210 @@
+"""Воспроизведение записи обновлений (RECORD_UPDATES) на фейковом Bot API со всеми
+хендлерами main.py. Скорость как в записи, ускоренная или максимальная.
+
+    python -m bench.replay updates.jsonl.gz [--speed 10] [--concurrency 0] [--output result.json]
+    python -m bench.replay updates.0.jsonl.gz updates.1.jsonl.gz --speed 0 --compare old.json
+
+Результат: задержка от постановки в очередь до конца обработки, вызовы Bot API
+на обновление по методам и контрольная сумма итогового состояния базы. Даты в /new
+считаются от текущего дня, поэтому суммы сравнимы между версиями в один день.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+
+from telegram import Update
+
+from bench.fake_api import BOT_USER, FakeBotAPI, make_builder
+from bench.suite import compare, git_revision
+from bench.timing import summary
+from core.access import ACCESS
+from core.chats import LazyChatsApplication
+from core.inbound import CALLBACKS, backlog
+from core.persistence import ChatSnapshot, SQLitePersistence
+from core.recorder import BOT_ID, RECORDER
+
+# вызовы, которые делает сам PTB при старте, на обновления не делятся
+SERVICE_METHODS = ("getMe", "deleteWebhook", "getUpdates")
+
+
+def read_log(paths: List[str]) -> Tuple[List[Tuple[float, dict]], Dict[int, deque]]:
+    """Обновления по времени и id сообщений с кнопками, отправленных ботом, по чатам"""
+    events = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # запись оборвалась на середине строки
+                    break
+    events.sort(key=lambda event: event["at"])
+
+    updates, sent = [], {}
+    for event in events:
+        if "update" in event:
+            updates.append((event["at"], event["update"]))
+        elif "sent" in event:
+            chat_id, message_id = event["sent"]
+            sent.setdefault(chat_id, deque()).append(message_id)
+    return updates, sent
+
+
+def restore_bot(data: dict) -> dict:
+    """Подставить фейкового бота автором его сообщений"""
+    for message in (data.get("message"), data.get("callback_query", {}).get("message")):
+        while message:
+            if message.get("from", {}).get("id") == BOT_ID:
+                message["from"] = BOT_USER
+            message = message.get("reply_to_message")
+    return data
+
+
+def chat_ids(updates: List[Tuple[float, dict]]) -> set:
+    return {
+        (data.get("message") or data["callback_query"]["message"])["chat"]["id"]
+        for _, data in updates
+    }
+
+
+class ReplayBotAPI(FakeBotAPI):
+    """Списки игр получают те же message_id, что и при записи, иначе нажатия
+    из записи не найдут свои игры. Остальные сообщения - id после записанных"""
+
+    def __init__(self, sent: Dict[int, deque], **kwargs):
+        super().__init__(**kwargs)
+        self.sent = sent
+        self.unmatched = 0
+        last = max((max(ids) for ids in sent.values()), default=0)
+        self._message_ids = iter(range(last + 10 ** 6, 10 ** 12))
+
+    def _respond(self, endpoint: str, params: dict):
+        result = super()._respond(endpoint, params)
+        if endpoint == "sendMessage" and "reply_markup" in params:
+            ids = self.sent.get(params.get("chat_id"))
+            if ids:
+                result["message_id"] = ids.popleft()
+            else:
+                self.unmatched += 1
+        return result
+
+
+class ReplayApplication(LazyChatsApplication):
+    """Замеряет время от постановки обновления в очередь до конца его обработки"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.queued: Dict[int, float] = {}
+        self.latencies: List[float] = []
+
+    async def process_update(self, update: object) -> None:
+        try:
+            await super().process_update(update)
+        finally:
+            queued = self.queued.pop(id(update), None)
+            if queued is not None:
+                self.latencies.append(time.perf_counter() - queued)
+
+
+def state_checksum(chats: Dict[int, dict]) -> str:
+    digest = hashlib.sha256()
+    for chat_id in sorted(chats):
+        snapshot = ChatSnapshot.of(chats[chat_id])
+        digest.update(
+            repr((chat_id, sorted(snapshot.games.items()), sorted(snapshot.custom_names.items()))).encode()
+        )
+    return digest.hexdigest()[:16]
+
+
+async def replay(paths: List[str], speed: float, concurrency: int) -> dict:
+    from main import build_application
+
+    updates, sent = read_log(paths)
+    if not updates:
+        raise SystemExit("No updates in the log")
+    ACCESS.allowed = chat_ids(updates)
+    # воспроизведение не пишет новую запись, даже если RECORD_UPDATES задан
+    RECORDER.path = ""
+
+    api = ReplayBotAPI(sent)
+    builder = make_builder(api).updater(None).application_class(ReplayApplication)
+    application = build_application(builder.concurrent_updates(concurrency or False))
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    service_calls = len(api.calls)
+
+    first_at = updates[0][0]
+    started = time.perf_counter()
+    for at, data in updates:
+        if speed:
+            delay = started + (at - first_at) / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(restore_bot(data), application.bot)
+        application.queued[id(update)] = time.perf_counter()
+        await application.update_queue.put(update)
+    while backlog(application):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+
+    calls: Dict[str, int] = {}
+    for _, method, _ in api.calls[service_calls:]:
+        if method not in SERVICE_METHODS:
+            calls[method] = calls.get(method, 0) + 1
+    # соединения хранилища закрыты при shutdown, база читается заново
+    chats = SQLitePersistence(filepath=application.persistence.filepath).load_all()
+    return {
+        "updates": len(updates),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(updates) / elapsed, 1),
+        "latency": summary(application.latencies),
+        "api_calls_per_update": round(sum(calls.values()) / len(updates), 3),
+        "api_calls": {method: round(count / len(updates), 3) for method, count in sorted(calls.items())},
+        "callbacks": CALLBACKS.stats(),
+        "unmatched_game_posts": api.unmatched,
+        "games": sum(1 for chat in chats.values() for key in chat if isinstance(key, int)),
+        "checksum": state_checksum(chats),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+", help="Файлы записи, у шардов - по файлу на воркер")
+    parser.add_argument("--speed", type=float, default=1, help="Во сколько раз быстрее записи, 0 - без пауз")
+    parser.add_argument("--concurrency", type=int, default=0, help="Как CONCURRENT_UPDATES")
+    parser.add_argument("--output", help="Куда записать JSON с результатами")
+    parser.add_argument("--compare", help="JSON прошлого воспроизведения для сравнения")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(replay(args.paths, args.speed, args.concurrency))
+    report = {"revision": git_revision(), "log": args.paths, "speed": args.speed, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        compare(old, report)
+        if old["results"].get("checksum") != results["checksum"]:
+            print(f"checksum differs: {old['results'].get('checksum')} -> {results['checksum']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Масштабирование по процессам: одни и те же обновления раздаются по chat_id на 1, 2, 4...
+воркеров, каждый со всеми хендлерами, фейковым Bot API и общей базой.
+
+    python -m bench.shards_scaling [--workers 1 2 4] [--chats 256] [--presses 20]
+
+Время считается от первого отправленного обновления до последнего обработанного
+(старт и остановка воркеров не входят). Масштабирование упирается в число ядер.
+"""
+import argparse
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from bench.fake_api import FakeBotAPI, callback_update, make_builder, message_update
+from core.persistence import SQLitePersistence
+from core.shards import ShardDispatcher, shard_of
+
+FIRST_MESSAGE_ID = 100000
+
+
+def bench_shard(db_path: str, results, index: int, count: int):
+    """Фабрика воркера: бот на фейковом API, отчитывается о готовности и обработанных обновлениях"""
+    from main import build_application
+
+    logging.getLogger().setLevel(logging.WARNING)
+    application = build_application(make_builder(FakeBotAPI(), db_path=db_path).updater(None))
+    processed = []
+    init, stop = application.post_init, application.post_stop
+
+    async def count_update(update, context):
+        processed.append(time.monotonic())
+
+    async def ready(app):
+        await init(app)
+        results.put(("ready", index))
+
+    async def done(app):
+        results.put(("done", index, len(processed), processed[-1] if processed else 0))
+        await stop(app)
+
+    application.add_handler(TypeHandler(Update, count_update), group=sys.maxsize)
+    application.post_init = ready
+    application.post_stop = done
+    return application
+
+
+def bench_chat_ids(chats: int) -> List[int]:
+    return [-1001000000000 - i for i in range(chats)]
+
+
+def workload(chats: int, presses: int, workers: int) -> List[tuple]:
+    """/new в каждом чате, потом нажатия вперемешку по чатам. id сообщения игры
+    известен заранее: воркер нумерует свои sendMessage по порядку"""
+    chat_ids = bench_chat_ids(chats)
+    message_ids = {}
+    per_shard = [0] * workers
+    for chat_id in chat_ids:
+        shard = shard_of(chat_id, workers)
+        message_ids[chat_id] = FIRST_MESSAGE_ID + per_shard[shard]
+        per_shard[shard] += 1
+
+    update_ids = iter(range(1, 10 ** 9))
+    updates = [(chat_id, message_update(next(update_ids), chat_id, 1, "/new 10.10.2099 #игра")) for chat_id in chat_ids]
+    for press in range(presses):
+        for chat_id in chat_ids:
+            data = ("i", "not_sure", "i+1", "i-1", "not_play")[press % 5]
+            user_id = 100 + press // 5
+            updates.append(
+                (chat_id, callback_update(next(update_ids), chat_id, user_id, message_ids[chat_id], data))
+            )
+    return updates
+
+
+def run(workers: int, chats: int, presses: int) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-shards-"), "chats_data.sqlite3")
+    results = multiprocessing.get_context("spawn").Queue()
+    dispatcher = ShardDispatcher(workers, functools.partial(bench_shard, db_path, results))
+    updates = workload(chats, presses, workers)
+
+    dispatcher.start()
+    for _ in range(workers):
+        results.get(timeout=60)
+
+    started = time.monotonic()
+    for chat_id, data in updates:
+        dispatcher.put(chat_id, data)
+    dispatcher.stop()
+
+    done = [results.get(timeout=60) for _ in range(workers)]
+    processed = sum(item[2] for item in done)
+    elapsed = max(item[3] for item in done) - started
+    return {
+        "workers": workers,
+        "updates": processed,
+        "expected": len(updates),
+        "games_saved": sum(1 for _ in SQLitePersistence(filepath=db_path).game_dates()),
+        "seconds": round(elapsed, 3),
+        "updates_per_s": round(processed / elapsed, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chats", type=int, default=256)
+    parser.add_argument("--presses", type=int, default=20)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    # воркеры запускаются через spawn и читают список чатов из окружения заново
+    os.environ["ALLOWED_CHAT_IDS"] = ",".join(map(str, bench_chat_ids(args.chats)))
+
+    runs = [run(workers, args.chats, args.presses) for workers in args.workers]
+    base = runs[0]["updates_per_s"]
+    for result in runs:
+        result["speedup"] = round(result["updates_per_s"] / base, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Холодный старт в отдельном процессе: импорт бота, загрузка базы, ответ на первое обновление.
+
+    python -m bench.startup [chats_data.sqlite3]
+
+Печатает JSON с временем от старта модуля до конца каждой фазы, в мс.
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+os.environ.setdefault("ALLOWED_CHAT_IDS", "-1001000000001")
+
+
+def elapsed() -> float:
+    return round((time.perf_counter() - STARTED) * 1000, 3)
+
+
+async def run(db_path: str) -> dict:
+    result = {}
+    from main import build_application
+
+    result["import_ms"] = elapsed()
+
+    from telegram import Update
+
+    from bench.fake_api import BENCH_CHAT_ID, FakeBotAPI, make_builder, message_update
+
+    api = FakeBotAPI()
+    application = build_application(make_builder(api, db_path=db_path).updater(None))
+    await application.initialize()
+    result["initialize_ms"] = elapsed()
+
+    update = Update.de_json(message_update(1, BENCH_CHAT_ID, 1, "/new 10.10.2099 #игра"), application.bot)
+    await application.process_update(update)
+    result["first_reply_ms"] = elapsed()
+    result["chats_loaded"] = len(application.chat_data)
+    await application.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    import logging
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(sys.argv[1] if len(sys.argv) > 1 else None))))
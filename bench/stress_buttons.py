@@ -0,0 +1,117 @@
+"""Стресс-проверка параллельной обработки: много пользователей одновременно жмут
+кнопки одной игры, а автор параллельно меняет цену. После обработки в списке
+должен быть ровно один "Я играю" и ровно plus_ones "+1" на каждого пользователя,
+и то же самое должно оказаться в базе. С --dedup повторные "Я играю" схлопываются
+до хендлеров, а каждый "+1" все равно доходит: гостей добавляют повторными нажатиями.
+
+    python -m bench.stress_buttons [--users 200] [--repeats 3] [--plus-ones 2] [--dedup]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import Counter
+
+from telegram import Update
+
+from bench.fake_api import BENCH_CHAT_ID, FakeBotAPI, callback_update, make_builder, message_update
+from commands.models import get_game
+from core.inbound import CALLBACKS
+from core.persistence import SQLitePersistence
+from main import build_application
+
+
+async def run(users: int, repeats: int, plus_ones: int, concurrency: int, dedup: bool = False) -> int:
+    # без --dedup проверяются локи: каждое нажатие должно дойти до хендлера
+    if not dedup:
+        CALLBACKS.window = 0
+    CALLBACKS.max_backlog = 0
+    api = FakeBotAPI(jitter=0.005)
+    application = build_application(make_builder(api).updater(None).concurrent_updates(concurrency))
+    await application.initialize()
+    await application.start()
+
+    update_ids = iter(range(1, 10 ** 9))
+    await application.process_update(
+        _update(application, message_update(next(update_ids), BENCH_CHAT_ID, 1, "/new 10.10.2099 #стресс"))
+    )
+    message_id = next(message_id for message_id in application.chat_data[BENCH_CHAT_ID] if isinstance(message_id, int))
+
+    presses = [
+        (user_id, data)
+        for user_id in range(100, 100 + users)
+        for data in ["i"] * repeats + ["i+1"] * plus_ones
+    ]
+    random.shuffle(presses)
+
+    updates = [
+        _update(application, callback_update(next(update_ids), BENCH_CHAT_ID, user_id, message_id, data))
+        for user_id, data in presses
+    ]
+    prices = list(range(1000, 1000 + users // 10 + 1))
+    updates += [
+        _update(
+            application,
+            message_update(next(update_ids), BENCH_CHAT_ID, 1, f"/price {price}", reply_to=message_id),
+        )
+        for price in prices
+    ]
+
+    started = time.perf_counter()
+    for update in updates:
+        await application.update_queue.put(update)
+    while (
+        application.update_queue.qsize()
+        or api.calls_by_method().get("answerCallbackQuery", 0) < len(presses)
+        or api.calls_by_method().get("sendMessage", 0) < 1 + len(prices)
+    ):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    await application.update_persistence()
+    await application.stop()
+    await application.shutdown()
+
+    game = get_game(application.chat_data[BENCH_CHAT_ID], message_id)
+    counts = Counter((user.user_id, user.type) for user in game.participants)
+    errors = []
+    for user_id in range(100, 100 + users):
+        if counts[(user_id, "i")] != 1:
+            errors.append(f"user {user_id}: {counts[(user_id, 'i')]} entries of 'i'")
+        if counts[(user_id, "i+1")] != plus_ones:
+            errors.append(f"user {user_id}: {counts[(user_id, 'i+1')]} entries of 'i+1'")
+    if game.price not in prices:
+        errors.append(f"price {game.price} was never requested")
+    if len(game) != users * (1 + plus_ones):
+        errors.append(f"roster has {len(game)} entries, expected {users * (1 + plus_ones)}")
+
+    # соединения хранилища закрыты при shutdown, база читается заново
+    stored = SQLitePersistence(filepath=application.persistence.filepath).load_all()[BENCH_CHAT_ID][message_id]
+    if [(u.user_id, u.type) for u in stored.participants] != [(u.user_id, u.type) for u in game.participants]:
+        errors.append("persisted roster differs from memory")
+
+    for error in errors[:20]:
+        print(error)
+    print(
+        f"{len(updates)} updates, concurrency {concurrency}: {elapsed:.2f}s, "
+        f"{len(game)} roster entries, {CALLBACKS.duplicates} duplicates dropped, {len(errors)} errors"
+    )
+    return 1 if errors else 0
+
+
+def _update(application, data: dict) -> Update:
+    return Update.de_json(data, application.bot)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3, help="Сколько раз каждый жмет 'Я играю'")
+    parser.add_argument("--plus-ones", type=int, default=2, help="Сколько раз каждый жмет '+1 от меня'")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--dedup", action="store_true", help="Схлопывать повторные нажатия, как в работе")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(asyncio.run(run(args.users, args.repeats, args.plus_ones, args.concurrency, args.dedup)))
@@ -0,0 +1,344 @@
+"""Офлайн бенчмарки бота: хендлеры на фейковом Bot API, рендер списка,
+разбор аргументов, архив и /stats, сохранение и остановка event loop на нем,
+холодный старт.
+
+    python -m bench.suite [--output results.json] [--compare old.json] [--quick]
+
+Результат - JSON, при --compare печатается изменение каждой метрики относительно
+старого файла, так регрессии видно между версиями.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from telegram import Update
+
+from bench.fake_api import BENCH_CHAT_ID, FakeBotAPI, callback_update, make_builder, message_update
+from bench.timing import summary
+from commands.args import parse_date, parse_new_args
+from commands.common import EDITS, generate_message
+from commands.consts import TZ
+from commands.models import Game
+from core.persistence import ChatSnapshot, SQLitePersistence
+from main import build_application
+
+ROSTER_SIZES = (10, 50, 100, 250, 500)
+PERSISTENCE_SIZES = (100, 1000, 10000)
+DATE_INPUTS = ("10", "10.10", "10.10.2099")
+GAMES_PER_CHAT = 20
+PLAYERS_PER_GAME = 14
+
+
+async def drive(application, updates: List[dict]) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for data in updates:
+        update = Update.de_json(data, application.bot)
+        begin = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+    result = summary(latencies)
+    result["updates_per_s"] = round(len(updates) / elapsed, 1)
+    return result
+
+
+async def bench_handlers(count: int) -> dict:
+    api = FakeBotAPI()
+    application = build_application(make_builder(api).updater(None))
+    await application.initialize()
+    update_ids = iter(range(1, 10 ** 9))
+    result = {}
+
+    result["new_schedule"] = await drive(
+        application,
+        [
+            message_update(next(update_ids), BENCH_CHAT_ID, 1, f"/new {i % 28 + 1}.12.2099 #игра{i} ₽1000 ч.2")
+            for i in range(count)
+        ],
+    )
+    message_id = min(key for key in application.chat_data[BENCH_CHAT_ID] if isinstance(key, int))
+
+    presses = []
+    for data in ("i", "not_sure", "i+1", "i-1", "not_play"):
+        presses += [
+            callback_update(next(update_ids), BENCH_CHAT_ID, user_id, message_id, data)
+            for user_id in range(100, 100 + count)
+        ]
+    result["buttons"] = await drive(application, presses)
+
+    result["list_schedule"] = await drive(
+        application,
+        [message_update(next(update_ids), BENCH_CHAT_ID, 1, "/list") for _ in range(max(10, count // 10))],
+    )
+    result["api_calls"] = api.calls_by_method()
+
+    await EDITS.flush_all()
+    await application.shutdown()
+    return result
+
+
+def make_game(players: int, date: datetime = None) -> Game:
+    game = Game(date or datetime(2099, 12, 1, tzinfo=TZ), "#игра", 1)
+    for user_id in range(players):
+        game.join(user_id, "i" if user_id % 5 else "not_sure", f"Игрок {user_id}")
+    return game
+
+
+def time_per_call(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def bench_rendering(repeat: int) -> dict:
+    result = {}
+    for players in ROSTER_SIZES:
+        game = make_game(players)
+        custom_names = {user_id: f"Ник {user_id}" for user_id in range(0, players, 3)}
+
+        def cold():
+            game.text_cache = None
+            game.line_cache.clear()
+            generate_message(game, custom_names)
+
+        def one_change():
+            if not game.leave(players - 1):
+                game.join(players - 1, "i", "Игрок")
+            generate_message(game, custom_names)
+
+        def cached():
+            generate_message(game, custom_names)
+
+        result[str(players)] = {
+            "cold_us": round(time_per_call(cold, repeat), 2),
+            "one_change_us": round(time_per_call(one_change, repeat), 2),
+            "cached_us": round(time_per_call(cached, repeat), 2),
+            "text_size": len(generate_message(game, custom_names)),
+        }
+    return result
+
+
+def bench_parsing(repeat: int) -> dict:
+    from dateutil.parser import parse
+
+    now = datetime.now(tz=TZ)
+    result = {}
+    for text in DATE_INPUTS:
+        result[text] = {
+            "dateutil_us": round(time_per_call(lambda: parse(text, dayfirst=True), repeat), 2),
+            "parse_date_us": round(time_per_call(lambda: parse_date(text, now), repeat), 2),
+        }
+    args = "10.10.2099 19:30 #игра в зале ₽1000 ч.2 макс.16".split()
+    result["new_args_us"] = round(time_per_call(lambda: parse_new_args(args, now), repeat), 2)
+    return result
+
+
+def make_chats(games: int) -> Dict[int, dict]:
+    chats: Dict[int, dict] = {}
+    start = datetime(2099, 1, 1, tzinfo=TZ)
+    for i in range(games):
+        chat = chats.setdefault(-1001000000000 - i // GAMES_PER_CHAT, {"custom_names": {1: "Автор"}})
+        chat[1000 + i] = make_game(PLAYERS_PER_GAME, start + timedelta(days=i % 365))
+    return chats
+
+
+def bench_archive(days: int, games_per_day: int = 3, players: int = 20) -> dict:
+    """Архив прошедших игр загруженного чата за days дней и /stats по нему"""
+    from core.archive import GameArchive
+
+    archive = GameArchive(tempfile.mkdtemp(prefix="bench-archive-"))
+    start = datetime(2000, 1, 1, 19, tzinfo=TZ)
+    started = time.perf_counter()
+    for i in range(days * games_per_day):
+        game = Game(start + timedelta(days=i // games_per_day), "#игра", 1, max_players_count=players - 4)
+        for user_id in range(players):
+            game.join((i * 7 + user_id) % 200, ("i", "i", "not_sure", "i+1")[user_id % 4], f"Игрок {user_id}")
+        archive.add(BENCH_CHAT_ID, i, game)
+    add_us = (time.perf_counter() - started) / (days * games_per_day) * 1e6
+
+    stats = [time_per_call(lambda: archive.user_stats(BENCH_CHAT_ID), 1) / 1000 for _ in range(5)]
+    return {
+        "games": days * games_per_day,
+        "add_us": round(add_us, 1),
+        "stats_ms": round(statistics.median(stats), 2),
+        "bytes": sum(os.path.getsize(os.path.join(archive.directory, name)) for name in os.listdir(archive.directory)),
+    }
+
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+def bench_persistence(sizes) -> dict:
+    result = {}
+    for games in sizes:
+        chats = make_chats(games)
+        directory = tempfile.mkdtemp(prefix="bench-persistence-")
+
+        db_path = os.path.join(directory, "chats_data.sqlite3")
+        persistence = SQLitePersistence(filepath=db_path)
+        started = time.perf_counter()
+        for chat_id, chat in chats.items():
+            persistence.write_chat(chat_id, chat)
+        full = time.perf_counter() - started
+
+        chat_id, chat = next(iter(chats.items()))
+        game = next(value for key, value in chat.items() if isinstance(key, int))
+        latencies = []
+        for user_id in range(100):
+            game.join(10 ** 6 + user_id, "i", "Новый")
+            begin = time.perf_counter()
+            persistence.write_chat(chat_id, chat)
+            latencies.append(time.perf_counter() - begin)
+        persistence._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        started = time.perf_counter()
+        SQLitePersistence(filepath=db_path).load_all()
+        load = time.perf_counter() - started
+
+        pickle_path = os.path.join(directory, "chats_data.dat")
+        started = time.perf_counter()
+        with open(pickle_path, "wb") as f:
+            pickle.dump({"chat_data": chats, "user_data": {}, "bot_data": {}}, f)
+        pickle_flush = time.perf_counter() - started
+
+        result[str(games)] = {
+            "sqlite_full_write_ms": round(full * 1000, 3),
+            "sqlite_flush_one_change": summary(latencies),
+            "sqlite_load_ms": round(load * 1000, 3),
+            "sqlite_file_size": file_size(db_path),
+            "pickle_flush_ms": round(pickle_flush * 1000, 3),
+            "pickle_file_size": os.path.getsize(pickle_path),
+        }
+    return result
+
+
+async def bench_flush(games: int, rounds: int) -> dict:
+    """Сохранение, когда изменилось по игре в каждом чате: сколько event loop стоит при
+    старом пути PTB (deepcopy и запись на loop) и при снимке строк с записью в потоке"""
+    chats = make_chats(games)
+    persistence = SQLitePersistence(filepath=os.path.join(tempfile.mkdtemp(prefix="bench-flush-"), "chats.sqlite3"))
+    for chat_id, chat in chats.items():
+        persistence.write_chat(chat_id, chat)
+    games_by_chat = {
+        chat_id: [value for key, value in chat.items() if isinstance(key, int)] for chat_id, chat in chats.items()
+    }
+
+    inline, snapshot, total = [], [], []
+    for n in range(rounds):
+        for chat_games in games_by_chat.values():
+            chat_games[n % len(chat_games)].join(10 ** 6 + n, "i", "Новый")
+        begin = time.perf_counter()
+        for chat_id, chat in chats.items():
+            persistence.write_chat(chat_id, copy.deepcopy(chat))
+        inline.append(time.perf_counter() - begin)
+
+        for chat_games in games_by_chat.values():
+            chat_games[n % len(chat_games)].leave(10 ** 6 + n)
+        begin = time.perf_counter()
+        snapshots = {chat_id: ChatSnapshot.of(chat) for chat_id, chat in chats.items()}
+        snapshot.append(time.perf_counter() - begin)
+        await asyncio.get_running_loop().run_in_executor(None, persistence.write_snapshots, snapshots)
+        total.append(time.perf_counter() - begin)
+
+    return {
+        "games": games,
+        "chats": len(chats),
+        "inline_stall": summary(inline),
+        "snapshot_stall": summary(snapshot),
+        "threaded_total": summary(total),
+    }
+
+
+def bench_startup(games: int, runs: int) -> dict:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-startup-"), "chats_data.sqlite3")
+    persistence = SQLitePersistence(filepath=db_path)
+    for chat_id, chat in make_chats(games).items():
+        persistence.write_chat(chat_id, chat)
+
+    samples = [
+        json.loads(subprocess.check_output([sys.executable, "-m", "bench.startup", db_path], text=True))
+        for _ in range(runs)
+    ]
+    result = {key: round(statistics.median(sample[key] for sample in samples), 3) for key in samples[0]}
+    result["games"] = games
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def flatten(data: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old: dict, new: dict) -> None:
+    old_flat = flatten(old["results"])
+    for name, value in flatten(new["results"]).items():
+        if name in old_flat and old_flat[name]:
+            change = (value - old_flat[name]) / old_flat[name] * 100
+            print(f"{name:70} {old_flat[name]:>12} -> {value:>12} ({change:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", help="Куда записать JSON с результатами")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--quick", action="store_true", help="Меньше итераций и без 10k игр")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {
+        "handlers": asyncio.run(bench_handlers(100 if args.quick else 500)),
+        "rendering": bench_rendering(50 if args.quick else 500),
+        "parsing": bench_parsing(1000 if args.quick else 10000),
+        "archive": bench_archive(90 if args.quick else 365),
+        "persistence": bench_persistence(PERSISTENCE_SIZES[:2] if args.quick else PERSISTENCE_SIZES),
+        "flush": asyncio.run(bench_flush(1000 if args.quick else 10000, 5 if args.quick else 20)),
+        "startup": bench_startup(1000, 3 if args.quick else 7),
+    }
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Память на бота: N ботов в одном процессе (BOTS_CONFIG, общий пул соединений)
+против отдельного процесса на каждого бота. Каждый бот получает одинаковую нагрузку
+(/new и нажатия кнопок) на фейковом Bot API, RSS меряется после обработки.
+
+    python -m bench.tenants_memory [--bots 10] [--chats 5] [--presses 50]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+from telegram import Update
+
+from bench.fake_api import FakeBotAPI, callback_update, message_update
+from core.tenants import SharedRequest, bot_settings, register
+
+
+def rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def run_bots(bots: int, chats: int, presses: int) -> int:
+    from main import bot_builder, build_application
+
+    directory = tempfile.mkdtemp(prefix="bench-tenants-")
+    api = FakeBotAPI()
+    request = SharedRequest(api)
+    applications = []
+    for index in range(bots):
+        settings = bot_settings(
+            {
+                "name": f"bot{index}",
+                "token": f"{2000000 + index}:BENCH",
+                "allowed_chat_ids": [-1001000000000 - chat for chat in range(chats)],
+                "db_path": os.path.join(directory, f"bot{index}.sqlite3"),
+                "archive_dir": os.path.join(directory, f"archive{index}"),
+            }
+        )
+        register(settings)
+        builder = bot_builder(settings=settings, request=request).updater(None)
+        applications.append(build_application(builder, settings))
+
+    for application in applications:
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+
+    update_ids = iter(range(1, 10 ** 9))
+    for application in applications:
+        for chat in range(chats):
+            chat_id = -1001000000000 - chat
+            await application.process_update(
+                Update.de_json(message_update(next(update_ids), chat_id, 1, "/new 10.10.2099 #игра"), application.bot)
+            )
+            message_id = max(key for key in application.chat_data[chat_id] if isinstance(key, int))
+            for user_id in range(presses):
+                await application.process_update(
+                    Update.de_json(
+                        callback_update(next(update_ids), chat_id, 100 + user_id, message_id, "i"), application.bot
+                    )
+                )
+        await application.update_persistence()
+
+    rss = rss_kb()
+    for application in reversed(applications):
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+    return rss
+
+
+def child_rss(bots: int, chats: int, presses: int) -> int:
+    output = subprocess.check_output(
+        [sys.executable, "-m", "bench.tenants_memory", "--child", str(bots), "--chats", str(chats),
+         "--presses", str(presses)],
+        text=True,
+    )
+    return int(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--bots", type=int, default=10)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--presses", type=int, default=50)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.child:
+        print(asyncio.run(run_bots(args.child, args.chats, args.presses)))
+        return
+
+    single = child_rss(1, args.chats, args.presses)
+    shared = child_rss(args.bots, args.chats, args.presses)
+    print(
+        json.dumps(
+            {
+                "bots": args.bots,
+                "process_per_bot_mb": round(single * args.bots / 1024, 1),
+                "one_process_mb": round(shared / 1024, 1),
+                "per_bot_separate_mb": round(single / 1024, 1),
+                "per_bot_shared_mb": round(shared / args.bots / 1024, 1),
+                "extra_per_bot_mb": round((shared - single) / max(args.bots - 1, 1) / 1024, 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
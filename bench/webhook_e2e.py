@@ -0,0 +1,124 @@
+"""Задержка от получения обновления до первого ответа бота: вебхук против polling.
+
+Bot API подменяется FakeBotAPI с заданной задержкой сети, обновления берутся из
+JSONL файла (по одному Update в строке) или генерируются: /new и нажатия кнопок.
+
+    python -m bench.webhook_e2e [updates.jsonl] [--rtt 0.05] [--count 50]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import secrets
+import time
+from typing import List
+
+from bench.fake_api import BENCH_CHAT_ID, FakeBotAPI, callback_update, make_builder, message_update
+from bench.timing import summary
+from core.webhook import WebhookServer, serve_webhook
+from main import build_application
+
+WEBHOOK_PATH = "/telegram"
+
+
+def synthetic_updates(count: int) -> List[dict]:
+    updates = [message_update(1, BENCH_CHAT_ID, 1, "/new 10.10.2099 #игра")]
+    for i in range(count):
+        updates.append(callback_update(i + 2, BENCH_CHAT_ID, 100 + i, 100000, "i"))
+    return updates
+
+
+class FirstReply:
+    """Ждет первый исходящий вызов Bot API после отправки обновления"""
+
+    def __init__(self, api: FakeBotAPI):
+        self.event = asyncio.Event()
+        api.listeners.append(lambda endpoint, params: self.event.set())
+
+    async def measure(self, send) -> float:
+        self.event.clear()
+        started = time.perf_counter()
+        await send()
+        await asyncio.wait_for(self.event.wait(), timeout=10)
+        return time.perf_counter() - started
+
+
+async def post(port: int, secret: str, update: dict) -> None:
+    body = json.dumps(update).encode()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        (
+            f"POST {WEBHOOK_PATH} HTTP/1.1\r\n"
+            f"Host: 127.0.0.1\r\n"
+            f"Content-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode()
+        + body
+    )
+    await writer.drain()
+    status = await reader.readline()
+    writer.close()
+    if b" 200 " not in status:
+        raise RuntimeError(f"Webhook answered {status!r}")
+
+
+async def run_webhook_mode(updates: List[dict], rtt: float) -> dict:
+    api = FakeBotAPI(rtt=rtt)
+    application = build_application(make_builder(api).updater(None))
+    secret = secrets.token_hex(16)
+    server = WebhookServer(application, "127.0.0.1", 0, WEBHOOK_PATH, secret_token=secret)
+    stop_event = asyncio.Event()
+    serving = asyncio.create_task(serve_webhook(server, f"https://example.invalid{WEBHOOK_PATH}", stop_event))
+    await server.ready.wait()
+
+    first_reply = FirstReply(api)
+    latencies = [await first_reply.measure(lambda: post(server.http.port, secret, update)) for update in updates]
+
+    stop_event.set()
+    await serving
+    return summary(latencies)
+
+
+async def run_polling_mode(updates: List[dict], rtt: float) -> dict:
+    api = FakeBotAPI(rtt=rtt)
+    application = build_application(make_builder(api))
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=10)
+
+    async def push(update):
+        api.push_update(update)
+
+    first_reply = FirstReply(api)
+    latencies = [await first_reply.measure(lambda: push(update)) for update in updates]
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return summary(latencies)
+
+
+async def main(args) -> None:
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.updates:
+        with open(args.updates) as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = synthetic_updates(args.count)
+
+    result = {
+        "rtt_ms": args.rtt * 1000,
+        "webhook": await run_webhook_mode(updates, args.rtt),
+        "polling": await run_polling_mode(updates, args.rtt),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("updates", nargs="?", help="JSONL файл с записанными Update")
+    parser.add_argument("--rtt", type=float, default=0.05, help="Задержка сети до Bot API, секунды")
+    parser.add_argument("--count", type=int, default=50, help="Сколько нажатий сгенерировать без файла")
+    asyncio.run(main(parser.parse_args()))
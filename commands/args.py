@@ -0,0 +1,181 @@
+"""Разбор аргументов команд: дата и модификаторы /new, поля /edit, числа для /price, /hour и т.д."""
+import calendar
+import re
+from datetime import datetime, time
+from typing import List, NamedTuple, Optional, Tuple
+
+from commands.consts import DEFAULTS, GAME_HOUR, GAME_PRICE, MAX_PLAYERS_COUNT, BotDefaults
+
+# 10, 10.10, 10.10.23, 10.10.2023, разделитель точка, слэш или дефис
+DATE_RE = re.compile(r"(\d{1,2})(?:[./-](\d{1,2})(?:[./-](\d{4}|\d{2}))?)?")
+ISO_DATE_RE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+TIME_RE = re.compile(r"([01]?\d|2[0-3]):([0-5]\d)")
+MODIFIER_RE = re.compile(r"(₽|ч\.|макс\.)(\S+)")
+
+EDIT_KEY_RE = re.compile(r"(\w+)=(.*)", re.S)
+
+MODIFIER_FIELDS = {
+    "₽": ("price", "Неверный формат цены!"),
+    "ч.": ("hour", "Неверный формат времени!"),
+    "макс.": ("max_players_count", "Неверный формат кол-ва!"),
+}
+
+
+EDIT_FIELDS = {
+    "price": ("price", "Неверный формат цены!"),
+    "hour": ("hour", "Неверный формат времени!"),
+    "max": ("max_players_count", "Неверный формат кол-ва!"),
+    "text": ("user_message", ""),
+    "date": ("date", ""),
+}
+
+
+class ArgumentError(ValueError):
+    """Ошибка в аргументах, текст показывается пользователю"""
+
+
+class NewGameArgs(NamedTuple):
+    date: datetime
+    user_message: str
+    price: int = GAME_PRICE
+    hour: int = GAME_HOUR
+    max_players_count: int = MAX_PLAYERS_COUNT
+
+
+def to_positive_int(text: str, invalid: str) -> int:
+    if not (text.isascii() and text.isdigit()):
+        raise ArgumentError(f"{invalid} Введите число.")
+    value = int(text)
+    if value <= 0:
+        raise ArgumentError(f"{invalid} Введите число больше 0.")
+    return value
+
+
+def positive_int(args: List[str], missing: str, invalid: str) -> int:
+    """Первый аргумент команды как целое больше 0"""
+    if not args:
+        raise ArgumentError(missing)
+    return to_positive_int(args[0], invalid)
+
+
+def add_month(date: datetime) -> datetime:
+    year, month = (date.year + 1, 1) if date.month == 12 else (date.year, date.month + 1)
+    return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
+
+
+def parse_date(text: str, now: datetime) -> datetime:
+    """Дата без времени, день идет первым. Прошедшее число переносится на следующий
+    месяц, прошедшая дата без года - на следующий год. Непривычные форматы отдаем dateutil"""
+    match = DATE_RE.fullmatch(text)
+    iso = None if match else ISO_DATE_RE.fullmatch(text)
+    try:
+        if match:
+            day, month, year = match.groups()
+            date = datetime(
+                (int(year) + 2000 if len(year) == 2 else int(year)) if year else now.year,
+                int(month) if month else now.month,
+                int(day),
+            )
+            if date.date() < now.date():
+                if not month:
+                    date = add_month(date)
+                elif not year:
+                    date = date.replace(year=date.year + 1)
+        elif iso:
+            date = datetime(*map(int, iso.groups()))
+        else:
+            from dateutil.parser import parse
+
+            date = parse(text, dayfirst=True, default=now.replace(tzinfo=None))
+            if date.date() < now.date():
+                date = add_month(date)
+    except (ValueError, OverflowError):
+        raise ArgumentError(f"Не получилось разобрать дату {text}")
+
+    return date.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def parse_new_args(
+    args: List[str], now: Optional[datetime] = None, defaults: BotDefaults = DEFAULTS
+) -> NewGameArgs:
+    """/new ДАТА [ЧЧ:ММ] ТЕКСТ [₽цена] [ч.часы] [макс.игроки], модификаторы в любом месте.
+    Чего нет в команде - из умолчаний бота"""
+    if not args:
+        raise ArgumentError("Не указана дата")
+    now = now or datetime.now(tz=defaults.tz)
+    date = parse_date(args[0], now)
+
+    fields = {"price": defaults.price, "hour": defaults.hour, "max_players_count": defaults.max_players_count}
+    start: Optional[time] = None
+    words = []
+    for arg in args[1:]:
+        modifier = MODIFIER_RE.fullmatch(arg)
+        if modifier:
+            field, invalid = MODIFIER_FIELDS[modifier.group(1)]
+            fields[field] = to_positive_int(modifier.group(2), invalid)
+            continue
+        start_time = TIME_RE.fullmatch(arg)
+        if start_time and start is None:
+            start = time(int(start_time.group(1)), int(start_time.group(2)))
+            continue
+        words.append(arg)
+
+    if start is not None:
+        date = date.replace(hour=start.hour, minute=start.minute)
+    return NewGameArgs(date=date.replace(tzinfo=defaults.tz), user_message=" ".join(words), **fields)
+
+
+def parse_edit_args(
+    args: List[str], now: Optional[datetime] = None, defaults: BotDefaults = DEFAULTS
+) -> Tuple[dict, Optional[time]]:
+    """/edit price=1000 hour=2 max=16 text=Игра в зале date=10.10 19:30
+
+    Слова без ключа дописываются к значению предыдущего ключа. Проверяются все поля
+    сразу, ошибки собираются в одну. Возвращает поля Game и время начала, если оно
+    было указано в date (без него время игры не меняется)"""
+    values = {}
+    key = None
+    for arg in args:
+        pair = EDIT_KEY_RE.fullmatch(arg)
+        if pair and pair.group(1) in EDIT_FIELDS:
+            key = pair.group(1)
+            if key in values:
+                raise ArgumentError(f"Поле {key} указано дважды")
+            values[key] = [pair.group(2)] if pair.group(2) else []
+        elif pair and key != "text":
+            raise ArgumentError(f"Неизвестное поле {pair.group(1)}, можно: {', '.join(EDIT_FIELDS)}")
+        elif key is None:
+            raise ArgumentError(f"Не понял {arg}, нужно поле=значение")
+        else:
+            values[key].append(arg)
+    if not values:
+        raise ArgumentError("Не указано, что поменять")
+
+    fields = {}
+    start: Optional[time] = None
+    errors = []
+    for key, words in values.items():
+        field, invalid = EDIT_FIELDS[key]
+        if not words:
+            errors.append(f"Не указано значение {key}")
+            continue
+        try:
+            if key == "text":
+                fields[field] = " ".join(words)
+            elif key == "date":
+                start_time = TIME_RE.fullmatch(words[-1]) if len(words) == 2 else None
+                if len(words) > 2 or (len(words) == 2 and not start_time):
+                    raise ArgumentError(f"Неверный формат даты {' '.join(words)}, нужно ДАТА [ЧЧ:ММ]")
+                date = parse_date(words[0], now or datetime.now(tz=defaults.tz))
+                if start_time:
+                    start = time(int(start_time.group(1)), int(start_time.group(2)))
+                fields[field] = date.replace(tzinfo=defaults.tz)
+            elif len(words) > 1:
+                raise ArgumentError(f"{invalid} Введите число.")
+            else:
+                fields[field] = to_positive_int(words[0], invalid)
+        except ArgumentError as e:
+            errors.append(str(e))
+    if errors:
+        raise ArgumentError("\n".join(errors))
+    return fields, start
@@ -1,36 +1,51 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from commands.common import check_access
+from commands.models import get_game
+from core.locks import game_lock
+from core.outbound import Priority
+from core.reminders import REMINDERS
 
 
 async def delete_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    access = await check_access(update, context)
-    if not access:
+    if update.message.reply_to_message is None:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            reply_to_message_id=update.message.id,
+            rate_limit_args=Priority.INFO,
+            text="Отправьте команду ответом на сообщение с игрой!",
+        )
         return
 
     message_id = update.message.reply_to_message.message_id
-    if message_id in context.chat_data:
-        if update.effective_user.id != context.chat_data[message_id]["author"]:
+    async with game_lock(update.effective_chat.id, message_id):
+        game = get_game(context.chat_data, message_id)
+        if game is None:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                reply_to_message_id=update.message.id,
+                rate_limit_args=Priority.INFO,
+                text="Игра не найдена!",
+            )
+            return
+        if update.effective_user.id != game.author:
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 reply_to_message_id=update.message.id,
+                rate_limit_args=Priority.INFO,
                 text="Удалять может только автор!",
             )
             return
         del context.chat_data[message_id]
-        await context.bot.delete_message(
-            chat_id=update.effective_chat.id,
-            message_id=message_id,
-        )
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            reply_to_message_id=update.message.id,
-            text="Игра удалена!",
-        )
-    else:
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            reply_to_message_id=update.message.id,
-            text="Игра не найдена!",
-        )
+        REMINDERS.cancel(context.bot.id, update.effective_chat.id, message_id)
+
+    await context.bot.delete_message(
+        chat_id=update.effective_chat.id,
+        message_id=message_id,
+    )
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        reply_to_message_id=update.message.id,
+        rate_limit_args=Priority.INFO,
+        text="Игра удалена!",
+    )
@@ -0,0 +1,98 @@
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
+
+from commands.args import ArgumentError, parse_edit_args
+from commands.common import update_game_message
+from commands.consts import DEFAULTS, EDIT_ACK, BotDefaults
+from commands.models import get_game
+from core.expiry import EXPIRY
+from core.locks import game_lock
+from core.outbound import Priority
+from core.reminders import REMINDERS
+from core.tenants import settings_of
+
+EDIT_HELP = (
+    "Формат: ответом на игру `/edit поле=значение ...`\n"
+    "Поля: `price` - цена за час, `hour` - часов, `max` - максимум игроков, "
+    "`text` - текст, `date` - дата и время\n"
+    "Пример: `/edit price=1000 hour=2 max=16 date=10.10 19:30 text=#игра в зале`"
+)
+
+
+async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs) -> None:
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        reply_to_message_id=update.message.id,
+        rate_limit_args=Priority.INFO,
+        text=text,
+        **kwargs,
+    )
+
+
+async def edit_game(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    parse: Callable[[], dict],
+    done_text: str,
+    help_text: Optional[str] = None,
+) -> None:
+    """Общий путь /edit и /price, /hour, /max_players_count: все поля проверяются до
+    изменения игры, применяются разом, список перерисовывается и правится один раз"""
+    try:
+        fields = parse()
+    except ArgumentError as e:
+        if help_text:
+            await reply(update, context, f"{escape_markdown(str(e))}\n\n{help_text}", parse_mode=ParseMode.MARKDOWN)
+        else:
+            await reply(update, context, str(e))
+        return
+
+    if update.message.reply_to_message is None:
+        await reply(update, context, "Отправьте команду ответом на сообщение с игрой!")
+        return
+
+    chat_id = update.effective_chat.id
+    message_id = update.message.reply_to_message.message_id
+    async with game_lock(chat_id, message_id):
+        game = get_game(context.chat_data, message_id)
+        if game is None:
+            await reply(update, context, "Игра не найдена!")
+            return
+        if update.effective_user.id != game.author:
+            await reply(update, context, "Редактировать может только автор!")
+            return
+
+        start = fields.pop("start", None)
+        if "date" in fields:
+            # без времени в date время начала игры остается прежним
+            if start is None:
+                start = game.date.time()
+            fields["date"] = fields["date"].replace(hour=start.hour, minute=start.minute)
+        if game.update(**fields):
+            update_game_message(context, chat_id, message_id)
+            if "date" in fields:
+                EXPIRY.push(context.bot.id, game.date, chat_id, message_id)
+                REMINDERS.schedule(context.bot.id, chat_id, message_id, game.date)
+
+    if EDIT_ACK:
+        await reply(update, context, done_text)
+
+
+def parse_edit(args, defaults: BotDefaults = DEFAULTS) -> dict:
+    fields, start = parse_edit_args(args, defaults=defaults)
+    if start is not None:
+        fields["start"] = start
+    return fields
+
+
+async def edit_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поменять несколько полей игры одной командой"""
+    defaults = settings_of(context.bot.id).defaults
+    await edit_game(
+        update, context, lambda: parse_edit(context.args, defaults), "Игра обновлена!", help_text=EDIT_HELP
+    )
+
@@ -1,38 +1,135 @@
-import logging
-from copy import deepcopy
 from datetime import datetime
+from typing import List, Optional, Tuple
 
-from telegram import Update
+from telegram import Chat, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
 
-from commands.common import check_access
-from commands.consts import TZ
+from commands.models import Game, iter_games
+from core.archive import archive_game
+from core.outbound import Priority
+from core.tenants import DEFAULT, BotSettings, settings_of
 
+LIST_HEADER = "Ближайшие игры:\n\n"
 
-async def list_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    access = await check_access(update, context)
-    if not access:
-        return
 
-    if not context.chat_data:
+def game_link(chat: Chat, message_id: int) -> Optional[str]:
+    if chat.username:
+        return f"https://t.me/{chat.username}/{message_id}"
+    if str(chat.id).startswith("-100"):
+        return f"https://t.me/c/{str(chat.id)[4:]}/{message_id}"
+    return None
+
+
+def upcoming_games(chat_id: int, chat_data: dict, settings: BotSettings = DEFAULT) -> List[Tuple[int, Game]]:
+    """Будущие игры чата по дате, прошедшие уходят в архив"""
+    now_date_without_time = datetime.now(tz=settings.defaults.tz).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    games = []
+    for message_id, game in list(iter_games(chat_data)):
+        if now_date_without_time > game.date:
+            archive_game(chat_id, message_id, game, settings.archive)
+            del chat_data[message_id]
+            continue
+        games.append((message_id, game))
+    games.sort(key=lambda item: item[1].date)
+    return games
+
+
+def game_line(chat: Chat, message_id: int, game: Game) -> str:
+    title = escape_markdown(f"{game.date_text} {game.user_message}")
+    players = f"{min(len(game), game.max_players_count)}/{game.max_players_count}"
+    link = game_link(chat, message_id)
+    if link:
+        return f"[{title}]({link}) — {players}"
+    return f"{title} — {players}"
+
+
+def paginate(lines: List[str], limit: int = MessageLimit.MAX_TEXT_LENGTH - len(LIST_HEADER) - 32) -> List[str]:
+    pages = []
+    page = []
+    length = 0
+    for line in lines:
+        if page and length + len(line) + 1 > limit:
+            pages.append("\n".join(page))
+            page = []
+            length = 0
+        page.append(line)
+        length += len(line) + 1
+    if page:
+        pages.append("\n".join(page))
+    return pages
+
+
+def render_page(
+    chat: Chat, chat_data: dict, page: int, settings: BotSettings = DEFAULT
+) -> Optional[Tuple[str, Optional[InlineKeyboardMarkup]]]:
+    games = upcoming_games(chat.id, chat_data, settings)
+    if not games:
+        return None
+
+    pages = paginate([game_line(chat, message_id, game) for message_id, game in games])
+    page = max(0, min(page, len(pages) - 1))
+    text = f"{LIST_HEADER}{pages[page]}"
+    if len(pages) == 1:
+        return text, None
+
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"list:{page - 1}"))
+    navigation.append(InlineKeyboardButton(f"{page + 1}/{len(pages)}", callback_data="list:noop"))
+    if page < len(pages) - 1:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"list:{page + 1}"))
+    return text, InlineKeyboardMarkup([navigation])
+
+
+async def list_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rendered = render_page(update.effective_chat, context.chat_data, 0, settings_of(context.bot.id))
+    if rendered is None:
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             reply_to_message_id=update.message.id,
+            rate_limit_args=Priority.INFO,
             text="Список игр пуст!",
         )
         return
 
-    now_date_without_time = datetime.now(tz=TZ).replace(
-        hour=0, minute=0, second=0, microsecond=0
+    text, reply_markup = rendered
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        reply_to_message_id=update.message.id,
+        parse_mode=ParseMode.MARKDOWN,
+        disable_web_page_preview=True,
+        reply_markup=reply_markup,
+        text=text,
     )
-    for message_id, game in deepcopy(context.chat_data).items():
-        if message_id == "custom_names":
-            continue
-        if now_date_without_time > game["date"]:
-            del context.chat_data[message_id]
-            continue
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            reply_to_message_id=message_id,
-            text=f"{game['date_text']} {game['user_message']}",
+
+
+async def list_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание списка игр кнопками"""
+    query = update.callback_query
+    await query.answer()
+
+    page = query.data.split(":")[1]
+    if not page.isdigit():
+        return
+
+    rendered = render_page(update.effective_chat, context.chat_data, int(page), settings_of(context.bot.id))
+    if rendered is None:
+        await query.edit_message_text(text="Список игр пуст!")
+        return
+
+    text, reply_markup = rendered
+    try:
+        await query.edit_message_text(
+            text=text,
+            parse_mode=ParseMode.MARKDOWN,
+            disable_web_page_preview=True,
+            reply_markup=reply_markup,
         )
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
@@ -3,87 +3,55 @@ import logging
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from dateutil.parser import parse
-from dateutil.relativedelta import relativedelta
-from datetime import datetime
+from telegram.helpers import escape_markdown
 
-from commands.common import check_access
-from commands.consts import REPLY_MARKUP, GAME_HOUR, GAME_PRICE, ALLOWED_CHAT_IDS, TZ, MAX_PLAYERS_COUNT
+from commands.args import ArgumentError, parse_new_args
+from commands.consts import reply_markup
+from commands.models import Game
+from core.expiry import EXPIRY
+from core.outbound import Priority
+from core.reminders import REMINDERS
+from core.tenants import settings_of
 
 
 async def new_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    access = await check_access(update, context)
-    if not access:
-        return
-
     try:
-        date_time = parse(context.args.pop(0))
-        date_time = date_time.replace(tzinfo=TZ)
-        if date_time < datetime.now(tz=TZ):
-            date_time = date_time + relativedelta(months=1)
-    except Exception as e:
-        logging.warning(f"Error while parsing date - {e}")
+        args = parse_new_args(context.args, defaults=settings_of(context.bot.id).defaults)
+    except ArgumentError as e:
+        logging.warning(f"Error while parsing /new arguments - {e}")
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             reply_to_message_id=update.message.id,
+            rate_limit_args=Priority.INFO,
             parse_mode=ParseMode.MARKDOWN,
-            text="Неверный формат сообщения!\n"
+            text=f"{escape_markdown(str(e))}\n\n"
+            "Неверный формат сообщения!\n"
             "Формат: /new ДАТА ТЕКСТ\n"
             "Пример: `/new 10 #игра` (Дата текущего месяца)\n"
             "Пример: `/new 10.10.2023 #игра` (Конкретная дата)\n"
-            "Если хотим установить цену (за час) или продолжительность игры, то пишем так:\n"
-            "`/new 10.10.2023 #игра ₽1000 ч.2`",
+            "Если хотим установить цену (за час), продолжительность игры, максимум игроков "
+            "или время начала, то пишем так:\n"
+            "`/new 10.10.2023 19:30 #игра ₽1000 ч.2 макс.16`",
         )
         return
 
-    price = GAME_PRICE
-    hour = GAME_HOUR
-
-    logging.info(f"New game - {date_time} {context.args}")
-
-    for arg in context.args:
-        if arg.startswith("₽"):
-            try:
-                price = int(arg[1:])
-            except Exception:
-                price = GAME_PRICE
-
-            if price < 0:
-                price = GAME_PRICE
+    logging.info(f"New game - {args.date} {args.user_message}")
 
-        if arg.startswith("ч."):
-            try:
-                hour = int(arg[2:])
-            except Exception:
-                hour = GAME_HOUR
-
-            if hour < 0:
-                hour = GAME_HOUR
-
-    context.args = list(
-        filter(
-            lambda arg: not arg.startswith("₽") or not arg.startswith("ч."),
-            context.args,
-        )
+    game = Game(
+        date=args.date,
+        user_message=args.user_message,
+        author=update.effective_user.id,
+        price=args.price,
+        hour=args.hour,
+        max_players_count=args.max_players_count,
     )
-
-    user_message = " ".join(context.args)
-
-    date_text = date_time.strftime("%d.%m.%Y")
     message = await context.bot.send_message(
         chat_id=update.effective_chat.id,
         parse_mode=ParseMode.MARKDOWN,
-        reply_markup=REPLY_MARKUP,
-        text=f"{date_text} {user_message}\n" f"Список участников:\n\n",
+        reply_markup=reply_markup(),
+        text=f"{game.date_text} {game.user_message}\n" f"Список участников:\n\n",
     )
 
-    context.chat_data[message.message_id] = {
-        "date": date_time,
-        "date_text": date_text,
-        "user_message": user_message,
-        "author": update.effective_user.id,
-        "users": [],
-        "price": price,
-        "hour": hour,
-        "max_players_count": MAX_PLAYERS_COUNT,
-    }
+    context.chat_data[message.message_id] = game
+    EXPIRY.push(context.bot.id, game.date, update.effective_chat.id, message.message_id)
+    REMINDERS.schedule(context.bot.id, update.effective_chat.id, message.message_id, game.date)
@@ -1,30 +1,37 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from commands.common import check_access
+from commands.common import update_game_message
+from core.locks import chat_lock, game_lock
+from core.outbound import Priority
+from core.user_games import USER_GAMES
 
 
 async def mynameis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запомнить имя пользователя которое он введет после команды /mynameis"""
-    access = await check_access(update, context)
-    if not access:
-        return
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    async with chat_lock(chat_id):
+        custom_names = context.chat_data.setdefault("custom_names", {})
+        if context.args:
+            new_name = " ".join(context.args)
+            custom_names[user_id] = new_name
+            text = f"Теперь ты - {new_name}"
+        elif user_id in custom_names:
+            del custom_names[user_id]
+            text = f"Вернул твое настоящее имя!"
+        else:
+            return
 
-    if "custom_names" not in context.chat_data:
-        context.chat_data["custom_names"] = {}
+    # перерисовать только списки, где пользователь записан, правки уйдут пачкой через EDITS
+    for message_id, game in USER_GAMES.games_of(context.bot.id, chat_id, context.chat_data, user_id).items():
+        async with game_lock(chat_id, message_id):
+            game.touch()
+            update_game_message(context, chat_id, message_id)
 
-    if context.args:
-        new_name = " ".join(context.args)
-        context.chat_data["custom_names"][update.effective_user.id] = new_name
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            reply_to_message_id=update.message.id,
-            text=f"Теперь ты - {new_name}",
-        )
-    elif update.effective_user.id in context.chat_data["custom_names"]:
-        del context.chat_data["custom_names"][update.effective_user.id]
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            reply_to_message_id=update.message.id,
-            text=f"Вернул твое настоящее имя!",
-        )
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        reply_to_message_id=update.message.id,
+        rate_limit_args=Priority.INFO,
+        text=text,
+    )
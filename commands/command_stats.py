@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from telegram import Update
+from telegram.constants import MessageLimit
+from telegram.ext import ContextTypes
+
+from commands.args import ArgumentError, to_positive_int
+from core.outbound import Priority
+from core.tenants import settings_of
+
+STATS_LIMIT = 30
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика прошедших игр чата: /stats за все время, /stats 90 - за последние 90 дней"""
+    chat_id = update.effective_chat.id
+    settings = settings_of(context.bot.id)
+    try:
+        days = to_positive_int(context.args[0], "Неверный формат периода!") if context.args else None
+    except ArgumentError as e:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            reply_to_message_id=update.message.id,
+            rate_limit_args=Priority.INFO,
+            text=str(e),
+        )
+        return
+
+    since = datetime.now(tz=settings.defaults.tz) - timedelta(days=days) if days else None
+    # numpy и чтение файлов - в потоке, чтобы не держать event loop
+    games, users = await asyncio.get_running_loop().run_in_executor(
+        None, settings.archive.user_stats, chat_id, since
+    )
+    if not users:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            reply_to_message_id=update.message.id,
+            rate_limit_args=Priority.INFO,
+            text="Нет прошедших игр за этот период!" if days else "В архиве пока нет прошедших игр!",
+        )
+        return
+
+    names = settings.archive.names(chat_id)
+    names.update(context.chat_data.get("custom_names", {}))
+    lines = [f"Статистика {'за ' + str(days) + ' дн.' if days else 'за все время'}, игр: {games}", ""]
+    for i, user in enumerate(users[:STATS_LIMIT], 1):
+        guests = f" (+{user.guests})" if user.guests else ""
+        lines.append(
+            f"{i}. {names.get(user.user_id, user.user_id)} — игр {user.games}{guests}, "
+            f"в запасе {user.reserve}, под вопросом {user.not_sure}, {user.cost}₽"
+        )
+    if len(users) > STATS_LIMIT:
+        lines.append(f"... и еще {len(users) - STATS_LIMIT}")
+
+    await context.bot.send_message(
+        chat_id=chat_id,
+        reply_to_message_id=update.message.id,
+        rate_limit_args=Priority.INFO,
+        text="\n".join(lines)[: MessageLimit.MAX_TEXT_LENGTH],
+    )
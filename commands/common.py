@@ -1,17 +1,24 @@
-import logging
 import math
+from functools import lru_cache
 
 from telegram import User, Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 
-from commands.consts import GAME_PRICE, GAME_HOUR, MAX_PLAYERS_COUNT, REPLY_MARKUP, TYPE_TEXT_ADD, ALLOWED_CHAT_IDS
+from commands.consts import (
+    reply_markup,
+    TYPE_TEXT_ADD,
+    EDIT_DEBOUNCE_SECONDS,
+)
+from commands.models import Game, Participant, get_game
+from core.edits import EditScheduler
+from core.locks import game_lock
+from core.user_games import USER_GAMES
 
+EDITS = EditScheduler(window=EDIT_DEBOUNCE_SECONDS)
 
-def pretty_user_name(user: User, custom_name: str = "") -> str:
-    if custom_name:
-        return f"[{custom_name}](tg://user?id={user.id})"
 
+def user_display_name(user: User) -> str:
     user_full_name = " ".join(
         map(
             lambda s: s.strip() if s else "",
@@ -22,15 +29,35 @@ def pretty_user_name(user: User, custom_name: str = "") -> str:
     if not user_full_name:
         user_full_name = "@" + user.username
 
-    return f"[{user_full_name}](tg://user?id={user.id})"
+    return user_full_name
 
 
-def generate_message(game):
-    price = game.get("price", GAME_PRICE)
-    hour = game.get("hour", GAME_HOUR)
-    max_players = game.get("max_players_count", MAX_PLAYERS_COUNT)
+@lru_cache(maxsize=4096)
+def pretty_user_name(user_id: int, name: str, custom_name: str = "") -> str:
+    return f"[{custom_name or name}](tg://user?id={user_id})"
+
+
+def render_line(game: Game, seq: int, user: Participant, custom_names: dict) -> str:
+    """Строка участника без номера, кэшируется пока не поменялись имя или тип"""
+    key = (user.name, custom_names.get(user.user_id, ""), user.type)
+    cached = game.line_cache.get(seq)
+    if cached and cached[0] == key:
+        return cached[1]
+    line = f"{pretty_user_name(user.user_id, user.name, key[1])}{TYPE_TEXT_ADD.get(user.type, '')}"
+    game.line_cache[seq] = (key, line)
+    return line
+
+
+def generate_message(game: Game, custom_names: dict = None) -> str:
+    if game.text_cache and game.text_cache[0] == game.version:
+        return game.text_cache[1]
+
+    custom_names = custom_names or {}
+    price = game.price
+    hour = game.hour
+    max_players = game.max_players_count
     total_price = price * hour
-    total_users = len(game["users"])
+    total_users = len(game)
     try:
         if total_users > max_players:
             users_count = max_players
@@ -40,14 +67,14 @@ def generate_message(game):
     except Exception:
         price_per_user = 0
     users_numeric_list = []
-    for i, user in enumerate(game["users"], 1):
-        users_numeric_list.append(f"{i}. {user['username']}{user['type_text']}")
+    for i, (seq, user) in enumerate(game.roster_items(), 1):
+        users_numeric_list.append(f"{i}. {render_line(game, seq, user, custom_names)}")
         if i == max_players and total_users > max_players:
             users_numeric_list.append("--- Запасной список ---")
 
     users_text = "\n".join(users_numeric_list)
-    return (
-        f"{game['date_text']} {game['user_message']}\n"
+    text = (
+        f"{game.date_text} {game.user_message}\n"
         f"Список участников:\n"
         f"{users_text}"
         f"\n------\n"
@@ -56,6 +83,51 @@ def generate_message(game):
         f"Стоимость игры: `{total_price}₽`\n"
         f"С одного игрока: `{price_per_user}₽`"
     )
+    game.text_cache = (game.version, text)
+    return text
+
+
+def not_sure_text(game: Game, custom_names: dict) -> str:
+    not_sure_users = "\n".join(
+        pretty_user_name(user.user_id, user.name, custom_names.get(user.user_id, ""))
+        for user in game.participants
+        if user.type == "not_sure"
+    )
+    return f"Решите свои вопросы!\n{not_sure_users}"
+
+
+def update_game_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int) -> None:
+    """Перерисовать список игры, правка уйдет через EDITS с последним состоянием.
+    Если текст не изменился с прошлой отправки, запрос в API не делается"""
+    chat_data = context.chat_data
+    rendered = None
+
+    def render():
+        nonlocal rendered
+        game = get_game(chat_data, message_id)
+        if game is None or game.version == game.sent_version:
+            return None
+        text = generate_message(game, chat_data.get("custom_names"))
+        if hash(text) == game.sent_digest:
+            game.sent_version = game.version
+            return None
+        rendered = (game, game.version)
+        return text
+
+    def on_sent(text):
+        game, version = rendered
+        game.sent_version = version
+        game.sent_digest = hash(text)
+
+    EDITS.request(
+        context.bot,
+        chat_id,
+        message_id,
+        render,
+        on_sent,
+        reply_markup=reply_markup(),
+        parse_mode=ParseMode.MARKDOWN,
+    )
 
 
 async def buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -64,89 +136,48 @@ async def buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     message_id = query.message.message_id
     user_id = query.from_user.id
 
-    if_change = False
+    game = get_game(context.chat_data, message_id)
+    if game is None:
+        await query.answer(text="Игра не найдена")
+        return
 
-    if query.data in TYPE_TEXT_ADD:
-        username = pretty_user_name(
-            query.from_user, context.chat_data.get("custom_names", {}).get(user_id, "")
-        )
+    custom_names = context.chat_data.get("custom_names", {})
 
-        for user in context.chat_data[message_id]["users"]:
-            if (
-                user["id"] == user_id
-                and user["type"] in ["i", "not_sure"]
-                and query.data in ["i", "not_sure"]
-                and user["type"] != query.data
-            ):
-                user["type"] = query.data
-                user["type_text"] = TYPE_TEXT_ADD.get(query.data, "")
-                if_change = True
-                break
-            elif user["id"] == user_id and user["type"] == query.data and user["type"] == "i":
-                await query.answer()
-                return
-
-        if not if_change:
-            context.chat_data[message_id]["users"].append(
-                {
-                    "id": user_id,
-                    "username": username,
-                    "type": query.data,
-                    "type_text": TYPE_TEXT_ADD.get(query.data, ""),
-                }
-            )
-            if_change = True
-    elif query.data == "not_play":
-        for user in context.chat_data[message_id]["users"]:
-            if user["id"] == user_id and user["type"] in ["i", "not_sure"]:
-                context.chat_data[message_id]["users"].remove(user)
-                if_change = True
-                break
-    elif query.data == "i-1":
-        for user in context.chat_data[message_id]["users"]:
-            if user["id"] == user_id and user["type"] == "i+1":
-                context.chat_data[message_id]["users"].remove(user)
-                if_change = True
-                break
-    elif query.data == "check_not_sure":
-        if user_id != context.chat_data[message_id]["author"]:
+    if query.data == "check_not_sure":
+        if user_id != game.author:
             await query.answer(
                 text="Только автор игры может выполнять это действие",
                 show_alert=True
             )
             return
 
-        not_sure_users = []
-        for user in context.chat_data[message_id]["users"]:
-            if user["type"] == "not_sure":
-                not_sure_users.append(user["username"])
-
-        not_sure_users = "\n".join(not_sure_users)
+        await query.answer()
 
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             reply_to_message_id=message_id,
             parse_mode=ParseMode.MARKDOWN,
-            text=f"Решите свои вопросы!\n{not_sure_users}",
-        )
-
-    if if_change:
-        await query.edit_message_text(
-            text=generate_message(context.chat_data[message_id]),
-            reply_markup=REPLY_MARKUP,
-            parse_mode=ParseMode.MARKDOWN,
+            text=not_sure_text(game, custom_names),
         )
+        return
 
     await query.answer()
 
+    async with game_lock(update.effective_chat.id, message_id):
+        game = get_game(context.chat_data, message_id)
+        if game is None:
+            return
+
+        if_change = False
+
+        if query.data in TYPE_TEXT_ADD:
+            if_change = game.join(user_id, query.data, user_display_name(query.from_user))
+        elif query.data == "not_play":
+            if_change = game.leave(user_id)
+        elif query.data == "i-1":
+            if_change = game.remove_plus_one(user_id)
+
+        if if_change:
+            USER_GAMES.sync(context.bot.id, update.effective_chat.id, context.chat_data, message_id, user_id)
+            update_game_message(context, update.effective_chat.id, message_id)
 
-async def check_access(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    if update.effective_chat.id not in ALLOWED_CHAT_IDS:
-        logging.warning(f"Command not allowed try from - {update.effective_chat}")
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            reply_to_message_id=update.message.id,
-            text="Доступ запрещен!",
-        )
-        return False
-    return True
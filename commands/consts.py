@@ -1,37 +1,88 @@
 import os
+from functools import lru_cache
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
 
-from pytz import timezone
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-ALLOWED_CHAT_IDS = set(map(int, os.getenv("ALLOWED_CHAT_IDS", "").split(",")))
-TZ = timezone("Europe/Moscow")
+BOT_API_URL = os.getenv("BOT_API_URL", "")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+TZ = ZoneInfo("Europe/Moscow")
 GAME_PRICE = 2500
 GAME_HOUR = 3
 MAX_PLAYERS_COUNT = 14
 
+
+class BotDefaults(NamedTuple):
+    """Умолчания игр и часовой пояс бота, у каждого бота из BOTS_CONFIG свои"""
+
+    price: int = GAME_PRICE
+    hour: int = GAME_HOUR
+    max_players_count: int = MAX_PLAYERS_COUNT
+    tz: ZoneInfo = TZ
+
+
+DEFAULTS = BotDefaults()
+
+DB_PATH = os.getenv("DB_PATH", "chats_data.sqlite3")
+LEGACY_PICKLE_PATH = "chats_data.dat"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "2"))
+EDIT_DEBOUNCE_SECONDS = float(os.getenv("EDIT_DEBOUNCE_SECONDS", "1"))
+EDIT_ACK = os.getenv("EDIT_ACK", "1") != "0"
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "0"))
+SHARDS = int(os.getenv("SHARDS", "1"))
+CALLBACK_DEDUP_SECONDS = float(os.getenv("CALLBACK_DEDUP_SECONDS", "1"))
+SHED_BACKLOG = int(os.getenv("SHED_BACKLOG", "1000"))
+RECORD_UPDATES = os.getenv("RECORD_UPDATES", "")
+RECORD_SALT = os.getenv("RECORD_SALT", "")
+BOTS_CONFIG = os.getenv("BOTS_CONFIG", "")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "256"))
+REMINDERS_ENABLED = os.getenv("REMINDERS", "1") != "0"
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "3600"))
+CHAT_IDLE_SECONDS = float(os.getenv("CHAT_IDLE_SECONDS", "3600"))
+MAX_LOADED_CHATS = int(os.getenv("MAX_LOADED_CHATS", "1000"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
 TYPE_TEXT_ADD = {
     "i": "",
     "i+1": " от меня +1",
     "not_sure": " (под вопросом)",
 }
 
-REPLY_MARKUP = InlineKeyboardMarkup(
-    [
-        [
-            InlineKeyboardButton("Я играю", callback_data="i"),
-            InlineKeyboardButton("+1 от меня", callback_data="i+1"),
-            InlineKeyboardButton("-1 от меня", callback_data="i-1"),
-        ],
-        [
-            InlineKeyboardButton("Я под вопросом", callback_data="not_sure"),
-            InlineKeyboardButton("Я не играю", callback_data="not_play"),
-        ],
+
+@lru_cache(maxsize=None)
+def reply_markup():
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+    return InlineKeyboardMarkup(
         [
-            InlineKeyboardButton("Решить вопросы 😎", callback_data="check_not_sure"),
+            [
+                InlineKeyboardButton("Я играю", callback_data="i"),
+                InlineKeyboardButton("+1 от меня", callback_data="i+1"),
+                InlineKeyboardButton("-1 от меня", callback_data="i-1"),
+            ],
+            [
+                InlineKeyboardButton("Я под вопросом", callback_data="not_sure"),
+                InlineKeyboardButton("Я не играю", callback_data="not_play"),
+            ],
+            [
+                InlineKeyboardButton("Решить вопросы 😎", callback_data="check_not_sure"),
+            ]
         ]
-    ]
-)
\ No newline at end of file
+    )
+
+
+def __getattr__(name: str):
+    # клавиатура собирается при первом обращении, а не при импорте
+    if name == "REPLY_MARKUP":
+        return reply_markup()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
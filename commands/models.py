@@ -0,0 +1,197 @@
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from commands.consts import GAME_PRICE, GAME_HOUR, MAX_PLAYERS_COUNT
+
+LEGACY_USERNAME_RE = re.compile(r"^\[(?P<name>.*)\]\(tg://user\?id=-?\d+\)$", re.S)
+
+
+def legacy_name(username: str) -> str:
+    """Достать имя из старого формата `[Имя](tg://user?id=...)`"""
+    match = LEGACY_USERNAME_RE.match(username)
+    return match.group("name") if match else username
+
+
+class Participant:
+    __slots__ = ("user_id", "type", "name")
+
+    def __init__(self, user_id: int, type: str, name: str):
+        self.user_id = user_id
+        self.type = type
+        self.name = name
+
+    def __repr__(self):
+        return f"Participant({self.user_id!r}, {self.type!r}, {self.name!r})"
+
+
+class Game:
+    """Игра с упорядоченным списком участников и индексом по (user_id, type)"""
+
+    __slots__ = (
+        "date",
+        "user_message",
+        "author",
+        "price",
+        "hour",
+        "max_players_count",
+        "_roster",
+        "_index",
+        "_next_seq",
+        "version",
+        "sent_version",
+        "sent_digest",
+        "text_cache",
+        "line_cache",
+        "rows_cache",
+    )
+
+    FIELDS = ("date", "user_message", "price", "hour", "max_players_count")
+
+    def __init__(
+        self,
+        date: datetime,
+        user_message: str,
+        author: int,
+        price: int = GAME_PRICE,
+        hour: int = GAME_HOUR,
+        max_players_count: int = MAX_PLAYERS_COUNT,
+    ):
+        self.date = date
+        self.user_message = user_message
+        self.author = author
+        self.price = price
+        self.hour = hour
+        self.max_players_count = max_players_count
+        self._roster: Dict[int, Participant] = {}
+        self._index: Dict[Tuple[int, str], List[int]] = {}
+        self._next_seq = 0
+        self.version = 0
+        self.sent_version = -1
+        self.sent_digest: Optional[int] = None
+        self.text_cache: Optional[Tuple[int, str]] = None
+        self.line_cache: Dict[int, Tuple[tuple, str]] = {}
+        # (version, строки для базы): неизменившаяся игра не пересобирается при каждом сохранении
+        self.rows_cache: Optional[Tuple[int, tuple]] = None
+
+    @property
+    def date_text(self) -> str:
+        if self.date.hour or self.date.minute:
+            return self.date.strftime("%d.%m.%Y %H:%M")
+        return self.date.strftime("%d.%m.%Y")
+
+    @property
+    def participants(self) -> Iterator[Participant]:
+        return iter(self._roster.values())
+
+    def roster_items(self) -> Iterator[Tuple[int, Participant]]:
+        return iter(self._roster.items())
+
+    def __len__(self):
+        return len(self._roster)
+
+    def has(self, user_id: int, type: str) -> bool:
+        return (user_id, type) in self._index
+
+    def has_user(self, user_id: int) -> bool:
+        return any((user_id, type) in self._index for type in ("i", "not_sure", "i+1"))
+
+    def user_ids(self) -> set:
+        return {user_id for user_id, _ in self._index}
+
+    def append(self, participant: Participant) -> None:
+        """Добавить в конец списка без проверок, для восстановления из хранилища"""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._roster[seq] = participant
+        self._index.setdefault((participant.user_id, participant.type), []).append(seq)
+        self.version += 1
+
+    def _remove(self, user_id: int, type: str) -> bool:
+        seqs = self._index.get((user_id, type))
+        if not seqs:
+            return False
+        seq = seqs.pop(0)
+        del self._roster[seq]
+        self.line_cache.pop(seq, None)
+        if not seqs:
+            del self._index[(user_id, type)]
+        self.version += 1
+        return True
+
+    def _retype(self, user_id: int, old_type: str, new_type: str) -> None:
+        seqs = self._index.pop((user_id, old_type))
+        for seq in seqs:
+            self._roster[seq].type = new_type
+        self._index[(user_id, new_type)] = seqs
+        self.version += 1
+
+    def update(self, **fields) -> bool:
+        """Поменять поля игры, версия растет только если что-то реально изменилось"""
+        changed = False
+        for name, value in fields.items():
+            if name not in self.FIELDS:
+                raise AttributeError(name)
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed = True
+        if changed:
+            self.version += 1
+        return changed
+
+    def touch(self) -> None:
+        """Текст списка надо перерисовать, хотя поля игры не менялись (например, имя участника)"""
+        self.version += 1
+
+    def join(self, user_id: int, type: str, name: str) -> bool:
+        """Записать участника. "i" и "not_sure" - одно место в списке, которое
+        переключается без потери позиции, "i+1" можно добавлять несколько раз"""
+        if type in ("i", "not_sure"):
+            if self.has(user_id, type):
+                return False
+            other = "not_sure" if type == "i" else "i"
+            if self.has(user_id, other):
+                self._retype(user_id, other, type)
+                return True
+        self.append(Participant(user_id, type, name))
+        return True
+
+    def leave(self, user_id: int) -> bool:
+        return self._remove(user_id, "i") or self._remove(user_id, "not_sure")
+
+    def remove_plus_one(self, user_id: int) -> bool:
+        return self._remove(user_id, "i+1")
+
+    @classmethod
+    def from_legacy(cls, data: dict) -> "Game":
+        """Собрать игру из словаря, который раньше писал new_schedule"""
+        game = cls(
+            date=data["date"],
+            user_message=data["user_message"],
+            author=data["author"],
+            price=data.get("price", GAME_PRICE),
+            hour=data.get("hour", GAME_HOUR),
+            max_players_count=data.get("max_players_count", MAX_PLAYERS_COUNT),
+        )
+        for user in data["users"]:
+            game.append(Participant(user["id"], user["type"], legacy_name(user["username"])))
+        return game
+
+
+def is_legacy_game(key, value) -> bool:
+    return isinstance(key, int) and isinstance(value, dict) and "users" in value
+
+
+def get_game(chat_data: dict, message_id: int) -> Optional[Game]:
+    """Игра по id сообщения, старый словарь прозрачно заменяется на Game"""
+    game = chat_data.get(message_id)
+    if is_legacy_game(message_id, game):
+        game = chat_data[message_id] = Game.from_legacy(game)
+    return game if isinstance(game, Game) else None
+
+
+def iter_games(chat_data: dict) -> Iterator[Tuple[int, Game]]:
+    for message_id in [key for key in chat_data if isinstance(key, int)]:
+        game = get_game(chat_data, message_id)
+        if game is not None:
+            yield message_id, game
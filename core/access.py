@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Set
+
+from dotenv import dotenv_values, find_dotenv, load_dotenv
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, BaseHandler, ContextTypes
+
+from core.metrics import ACCESS_REJECTED
+from core.outbound import Priority
+
+load_dotenv()
+
+# как часто проверять, не поменялся ли ALLOWED_CHAT_IDS в .env
+RELOAD_INTERVAL = 10
+# не чаще одного ответа "Доступ запрещен!" в чат за столько секунд
+DENY_COOLDOWN = 3600
+# сколько чатов помнить в кэше ответов, сверх этого старые записи вычищаются
+MAX_COOLDOWN_ENTRIES = 10000
+
+
+def parse_chat_ids(text: str) -> Set[int]:
+    """Список id через запятую, пустые элементы пропускаются"""
+    return {int(chat_id) for chat_id in text.replace(" ", "").split(",") if chat_id}
+
+
+class AccessList:
+    """Список разрешенных чатов. Проверяется до хендлеров, список перечитывается
+    из .env без перезапуска, отказы отвечаются в чат не чаще раза за cooldown"""
+
+    def __init__(
+        self, env_path: Optional[str] = None, cooldown: float = DENY_COOLDOWN, allowed: Optional[Set[int]] = None
+    ):
+        # явный список без файла-источника не перечитывается
+        if allowed is not None and env_path is None:
+            env_path = ""
+        self.env_path = find_dotenv(usecwd=True) if env_path is None else env_path
+        self.cooldown = cooldown
+        self.allowed = parse_chat_ids(os.getenv("ALLOWED_CHAT_IDS", "")) if allowed is None else set(allowed)
+        self._mtime = self._env_mtime()
+        self._denied_at: Dict[int, float] = {}
+        self._replies: Set[asyncio.Task] = set()
+        self.rejected = 0
+        self.replied = 0
+
+    def _env_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.env_path) if self.env_path else None
+        except OSError:
+            return None
+
+    def reload(self) -> bool:
+        """Перечитать список, если файл-источник поменялся. При ошибке остается старый список"""
+        mtime = self._env_mtime()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            allowed = self._read_allowed() if mtime else None
+        except (OSError, TypeError, ValueError) as e:
+            logging.error(f"Bad allowed chats in {self.env_path}, keeping the old list - {e}")
+            return False
+        if allowed is None or allowed == self.allowed:
+            return False
+        logging.info(f"Allowed chats reloaded: {self.allowed} -> {allowed}")
+        self.allowed = allowed
+        return True
+
+    def _read_allowed(self) -> Optional[Set[int]]:
+        """Список из источника, None - в источнике его нет"""
+        text = dotenv_values(self.env_path).get("ALLOWED_CHAT_IDS")
+        return None if text is None else parse_chat_ids(text)
+
+    def _should_reply(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        denied_at = self._denied_at.get(chat_id)
+        if denied_at is not None and now - denied_at < self.cooldown:
+            return False
+        if len(self._denied_at) >= MAX_COOLDOWN_ENTRIES:
+            self._denied_at = {key: at for key, at in self._denied_at.items() if now - at < self.cooldown}
+        self._denied_at[chat_id] = now
+        return True
+
+    def reject(self, update: Update) -> bool:
+        """Обновление из чужого чата: посчитать и, если пора, ответить отказом"""
+        chat = update.effective_chat
+        if chat is None or chat.id in self.allowed:
+            return False
+
+        if update.callback_query:
+            kind = "callback"
+        elif update.message and update.message.text and update.message.text.startswith("/"):
+            kind = "command"
+        else:
+            kind = "other"
+        self.rejected += 1
+        ACCESS_REJECTED.inc(str(chat.id), kind)
+
+        if kind != "other" and self._should_reply(chat.id):
+            logging.warning(f"Command not allowed try from - {chat}")
+            self.replied += 1
+            task = asyncio.create_task(self._deny(update, kind))
+            self._replies.add(task)
+            task.add_done_callback(self._reply_done)
+        return True
+
+    async def _deny(self, update: Update, kind: str) -> None:
+        if kind == "callback":
+            await update.callback_query.answer(text="Доступ запрещен!")
+        else:
+            await update.get_bot().send_message(
+                chat_id=update.effective_chat.id,
+                reply_to_message_id=update.message.id,
+                rate_limit_args=Priority.INFO,
+                text="Доступ запрещен!",
+            )
+
+    def _reply_done(self, task: asyncio.Task) -> None:
+        self._replies.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.warning(f"Error while denying access - {task.exception()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"allowed": len(self.allowed), "rejected": self.rejected, "replied": self.replied}
+
+
+class AccessHandler(BaseHandler):
+    """Отсекает чужие чаты в check_update, до построения контекста: их chat_data
+    не загружается из базы и не сохраняется. Ставится в группу раньше всех хендлеров"""
+
+    def __init__(self, access: AccessList):
+        super().__init__(self._never_called)
+        self.access = access
+
+    def check_update(self, update: object) -> None:
+        if isinstance(update, Update) and self.access.reject(update):
+            raise ApplicationHandlerStop
+        return None
+
+    @staticmethod
+    async def _never_called(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        pass
+
+
+ACCESS = AccessList()
+
+
+async def reload_access(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача JobQueue, в data - список чатов своего бота, без data - общий из .env"""
+    access = context.job.data if context.job and context.job.data is not None else ACCESS
+    access.reload()
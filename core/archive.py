@@ -0,0 +1,203 @@
+"""Архив прошедших игр отдельно от chat_data: по два файла записей фиксированной
+ширины на чат (игры и участники) и журнал имен. Файлы только дописываются,
+numpy читает их целиком одним вызовом и считает статистику векторно.
+
+Хранение построчное (структурные массивы numpy), а не по файлу на колонку: игра
+дописывается одной записью в конец файла, и сбой посреди записи оставляет только
+недописанный хвост, который отбрасывается по размеру. С файлами колонок сбой между
+ними рассинхронизировал бы колонки. Колонки при чтении - срезы без копирования
+(rows["user_id"]), а архив активного чата за год - около полумегабайта, так что
+чтение лишних полей ничего не стоит.
+"""
+import json
+import logging
+import math
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from commands.consts import ARCHIVE_DIR
+from commands.models import Game
+
+# коды типов участника в архиве
+TYPE_CODES = {"i": 0, "i+1": 1, "not_sure": 2}
+
+
+@lru_cache(maxsize=None)
+def game_dtype():
+    import numpy as np
+
+    return np.dtype(
+        [
+            ("message_id", "<i8"),
+            ("date", "<i8"),
+            ("price", "<i4"),
+            ("hour", "<i4"),
+            ("max_players_count", "<i4"),
+            ("per_player", "<i4"),
+        ]
+    )
+
+
+@lru_cache(maxsize=None)
+def player_dtype():
+    import numpy as np
+
+    return np.dtype(
+        [
+            ("message_id", "<i8"),
+            ("user_id", "<i8"),
+            ("position", "<i4"),
+            ("type", "i1"),
+            ("reserve", "?"),
+        ]
+    )
+
+
+def read_rows(path: str, dtype):
+    """Целые записи файла, недописанный хвост (сбой во время записи) пропускается"""
+    import numpy as np
+
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    return np.fromfile(path, dtype=dtype, count=count) if count else np.zeros(0, dtype)
+
+
+def per_player_cost(game: Game) -> int:
+    """С одного игрока, как в списке игры"""
+    players = min(len(game), game.max_players_count)
+    return math.ceil(game.price * game.hour / players) if players else 0
+
+
+class UserStats(NamedTuple):
+    user_id: int
+    games: int
+    guests: int
+    reserve: int
+    not_sure: int
+    cost: int
+
+
+class GameArchive:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._known_names: Dict[int, Dict[int, str]] = {}
+        self.archived = 0
+
+    def _path(self, chat_id: int, kind: str) -> str:
+        return os.path.join(self.directory, f"{chat_id}.{kind}")
+
+    def add(self, chat_id: int, message_id: int, game: Game) -> None:
+        """Дописать игру в архив чата, вызывается перед удалением прошедшей игры"""
+        import numpy as np
+
+        os.makedirs(self.directory, exist_ok=True)
+        game_row = np.array(
+            [
+                (
+                    message_id,
+                    int(game.date.timestamp()),
+                    game.price,
+                    game.hour,
+                    game.max_players_count,
+                    per_player_cost(game),
+                )
+            ],
+            dtype=game_dtype(),
+        )
+        players = np.array(
+            [
+                (message_id, user.user_id, position, TYPE_CODES.get(user.type, -1), position >= game.max_players_count)
+                for position, user in enumerate(game.participants)
+            ],
+            dtype=player_dtype(),
+        )
+        # сначала участники: игра без участников при сбое лучше участников без игры
+        with open(self._path(chat_id, "players"), "ab") as f:
+            f.write(players.tobytes())
+        with open(self._path(chat_id, "games"), "ab") as f:
+            f.write(game_row.tobytes())
+
+        names = self._names(chat_id)
+        new_names = {user.user_id: user.name for user in game.participants if names.get(user.user_id) != user.name}
+        if new_names:
+            with open(self._path(chat_id, "names"), "a", encoding="utf-8") as f:
+                for user_id, name in new_names.items():
+                    f.write(json.dumps([user_id, name], ensure_ascii=False) + "\n")
+            names.update(new_names)
+        self.archived += 1
+
+    def _names(self, chat_id: int) -> Dict[int, str]:
+        names = self._known_names.get(chat_id)
+        if names is None:
+            names = self._known_names[chat_id] = {}
+            path = self._path(chat_id, "names")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        user_id, name = json.loads(line)
+                        names[user_id] = name
+        return names
+
+    def names(self, chat_id: int) -> Dict[int, str]:
+        return dict(self._names(chat_id))
+
+    def load(self, chat_id: int, since: Optional[datetime] = None):
+        """Игры и участники чата как массивы numpy, повторы игры (архивировали дважды) убраны"""
+        import numpy as np
+
+        games = read_rows(self._path(chat_id, "games"), game_dtype())
+        players = read_rows(self._path(chat_id, "players"), player_dtype())
+
+        _, first = np.unique(games["message_id"], return_index=True)
+        games = games[np.sort(first)]
+        if since is not None:
+            games = games[games["date"] >= int(since.timestamp())]
+
+        key = (players["message_id"] << 16) | players["position"]
+        _, first = np.unique(key, return_index=True)
+        players = players[np.sort(first)]
+        players = players[np.isin(players["message_id"], games["message_id"])]
+        return games, players
+
+    def user_stats(self, chat_id: int, since: Optional[datetime] = None) -> Tuple[int, List[UserStats]]:
+        """Кол-во игр и по пользователям: сыграно игр, гостей +1, раз в запасе, раз под вопросом,
+        сколько заплатил. Сортировка по сыгранным играм"""
+        import numpy as np
+
+        games, players = self.load(chat_id, since)
+        if not len(players):
+            return len(games), []
+
+        order = np.argsort(games["message_id"])
+        per_player = games["per_player"][order][np.searchsorted(games["message_id"][order], players["message_id"])]
+        main_list = ~players["reserve"]
+        played = main_list & (players["type"] == TYPE_CODES["i"])
+        guests = main_list & (players["type"] == TYPE_CODES["i+1"])
+
+        user_ids, inverse = np.unique(players["user_id"], return_inverse=True)
+        inverse = inverse.ravel()
+        size = len(user_ids)
+        counts = {
+            "games": np.bincount(inverse, weights=played, minlength=size),
+            "guests": np.bincount(inverse, weights=guests, minlength=size),
+            "reserve": np.bincount(inverse, weights=players["reserve"], minlength=size),
+            "not_sure": np.bincount(inverse, weights=players["type"] == TYPE_CODES["not_sure"], minlength=size),
+            "cost": np.bincount(inverse, weights=per_player * (played | guests), minlength=size),
+        }
+        rank = np.lexsort((-counts["cost"], -counts["games"]))
+        return len(games), [
+            UserStats(int(user_ids[i]), *(int(counts[name][i]) for name in UserStats._fields[1:]))
+            for i in rank
+        ]
+
+
+ARCHIVE = GameArchive(ARCHIVE_DIR)
+
+
+def archive_game(chat_id: int, message_id: int, game: Game, archive: Optional[GameArchive] = None) -> None:
+    """Сохранить прошедшую игру перед удалением, ошибка архива не мешает удалению"""
+    try:
+        (ARCHIVE if archive is None else archive).add(chat_id, message_id, game)
+    except Exception as e:
+        logging.warning(f"Error while archiving game {message_id} in {chat_id} - {e}")
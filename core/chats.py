@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from types import MappingProxyType
+from typing import Dict, List
+
+from telegram.ext import Application, ContextTypes
+
+from core.persistence import SQLitePersistence
+from core.user_games import USER_GAMES
+
+EVICT_INTERVAL = 60
+# моложе этого не выгружаем даже сверх лимита: хендлер может еще держать ссылку на chat_data
+MIN_IDLE_SECONDS = 60
+
+
+class ChatStore(dict):
+    """chat_data, в которой чат читается из базы при первом обращении.
+    Порядок last_used - от давно не использованных к свежим"""
+
+    def __init__(self, persistence: SQLitePersistence):
+        super().__init__()
+        self.persistence = persistence
+        self.last_used: Dict[int, float] = {}
+        self.loaded = 0
+        self.evicted = 0
+
+    def __missing__(self, chat_id: int) -> dict:
+        data = self.persistence.load_chat(chat_id)
+        self[chat_id] = data
+        self.loaded += 1
+        return data
+
+    def __getitem__(self, chat_id: int) -> dict:
+        self.last_used.pop(chat_id, None)
+        self.last_used[chat_id] = time.monotonic()
+        return super().__getitem__(chat_id)
+
+    def candidates(self, idle_seconds: float, max_chats: int) -> List[int]:
+        """Чаты на выгрузку: простаивающие дольше idle_seconds и самые старые сверх max_chats"""
+        now = time.monotonic()
+        over_budget = len(self) - max_chats
+        chat_ids = []
+        for chat_id, used in self.last_used.items():
+            idle = now - used
+            if idle < MIN_IDLE_SECONDS or (idle < idle_seconds and over_budget <= 0):
+                break
+            chat_ids.append(chat_id)
+            over_budget -= 1
+        return chat_ids
+
+    def stats(self) -> Dict[str, int]:
+        return {"chats": len(self), "loaded": self.loaded, "evicted": self.evicted}
+
+
+class LazyChatsApplication(Application):
+    """Application, которая держит в памяти только недавно использованные чаты"""
+
+    def __init__(self, *, idle_seconds: float = 3600, max_chats: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        if not isinstance(self.persistence, SQLitePersistence):
+            raise TypeError("LazyChatsApplication needs SQLitePersistence")
+        self.persistence.lazy = True
+        self.idle_seconds = idle_seconds
+        self.max_chats = max_chats
+        self.chat_store = ChatStore(self.persistence)
+        self._chat_data = self.chat_store
+        self.chat_data = MappingProxyType(self.chat_store)
+        # сохранение и выгрузка не пересекаются: выгруженный чат не прочитается
+        # из базы раньше, чем поток записи допишет его последние изменения
+        self._flush_lock = asyncio.Lock()
+
+    async def update_persistence(self) -> None:
+        """Вместо deepcopy каждого чата в PTB: снимок строк на event loop, запись в потоке.
+        Храним только chat_data, остальное PTB в SQLitePersistence выключено"""
+        async with self._flush_lock:
+            updated = self._chat_ids_to_be_updated_in_persistence
+            deleted = self._chat_ids_to_be_deleted_in_persistence
+            self._chat_ids_to_be_updated_in_persistence = set()
+            self._chat_ids_to_be_deleted_in_persistence = set()
+            # dict.get мимо ChatStore.__getitem__: сохранение не должно освежать last_used
+            chats = {
+                chat_id: data
+                for chat_id in updated - deleted
+                if (data := dict.get(self.chat_store, chat_id)) is not None
+            }
+            try:
+                await self.persistence.save_chats(chats, deleted)
+            except Exception:
+                # не потерять изменения: чаты запишутся в следующий раз
+                self._chat_ids_to_be_updated_in_persistence |= updated - deleted
+                self._chat_ids_to_be_deleted_in_persistence |= deleted
+                raise
+
+    async def evict_chats(self) -> int:
+        """Выгрузить холодные чаты, несохраненные изменения пишутся в базу до выгрузки"""
+        async with self._flush_lock:
+            candidates = {
+                chat_id: self.chat_store.last_used[chat_id]
+                for chat_id in self.chat_store.candidates(self.idle_seconds, self.max_chats)
+            }
+            dirty = {
+                chat_id: data
+                for chat_id in candidates
+                if chat_id in self._chat_ids_to_be_updated_in_persistence
+                and (data := dict.get(self.chat_store, chat_id)) is not None
+            }
+            self._chat_ids_to_be_updated_in_persistence -= dirty.keys()
+            # чат остается в памяти до конца записи, иначе его бы перечитали из базы без изменений
+            await self.persistence.save_chats(dirty)
+
+            evicted = 0
+            for chat_id, used in candidates.items():
+                # пока шла запись, к чату могли обратиться - тогда он уже не холодный
+                if self.chat_store.last_used.get(chat_id) != used:
+                    continue
+                self.chat_store.last_used.pop(chat_id)
+                if self.chat_store.pop(chat_id, None) is None:
+                    continue
+                self.persistence.forget_chat(chat_id)
+                USER_GAMES.forget(self.bot.id, chat_id)
+                evicted += 1
+
+        self.chat_store.evicted += evicted
+        return evicted
+
+
+async def evict_chats(context: ContextTypes.DEFAULT_TYPE) -> None:
+    evicted = await context.application.evict_chats()
+    if evicted:
+        logging.info(f"Evicted {evicted} idle chats, {len(context.application.chat_store)} in memory")
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+
+EditKey = Tuple[int, int, int]
+
+
+class PendingEdit:
+    __slots__ = ("bot", "chat_id", "message_id", "render", "on_sent", "kwargs", "handle")
+
+    def __init__(self, bot: Bot, chat_id: int, message_id: int, render, on_sent, kwargs):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.render = render
+        self.on_sent = on_sent
+        self.kwargs = kwargs
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class EditScheduler:
+    """Склеивает частые правки одного сообщения: не чаще одной за window секунд,
+    в сообщение уходит последнее состояние"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._pending: Dict[EditKey, PendingEdit] = {}
+        self._inflight: Dict[EditKey, asyncio.Task] = {}
+        self._last_flush: Dict[EditKey, float] = {}
+        self.requested = 0
+        self.collapsed = 0
+        self.flushed = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def request(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        render: Callable[[], Optional[str]],
+        on_sent: Callable[[str], Any] = None,
+        **kwargs,
+    ) -> None:
+        """Пометить сообщение грязным. render вызывается в момент отправки,
+        None из render означает что править нечего"""
+        key = (bot.id, chat_id, message_id)
+        self.requested += 1
+
+        pending = self._pending.get(key)
+        if pending:
+            pending.render = render
+            pending.on_sent = on_sent
+            pending.kwargs = kwargs
+            self.collapsed += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        last_flush = self._last_flush.get(key)
+        delay = 0 if last_flush is None else max(0.0, last_flush + self.window - loop.time())
+        pending = PendingEdit(bot, chat_id, message_id, render, on_sent, kwargs)
+        pending.handle = loop.call_later(delay, self._start, key)
+        self._pending[key] = pending
+
+    def _start(self, key: EditKey) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        previous = self._inflight.get(key)
+        task = asyncio.create_task(self._flush(key, pending, previous))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._forget_task(key, task))
+
+    def _forget_task(self, key: EditKey, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def _forget_flush(self, key: EditKey, stamp: float) -> None:
+        if self._last_flush.get(key) == stamp:
+            del self._last_flush[key]
+
+    async def _flush(self, key: EditKey, pending: PendingEdit, previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        loop = asyncio.get_running_loop()
+        stamp = loop.time()
+        self._last_flush[key] = stamp
+        loop.call_later(self.window, self._forget_flush, key, stamp)
+
+        text = pending.render()
+        if text is None:
+            self.skipped += 1
+            return
+
+        try:
+            await pending.bot.edit_message_text(
+                text=text,
+                chat_id=pending.chat_id,
+                message_id=pending.message_id,
+                **pending.kwargs,
+            )
+        except RetryAfter as e:
+            logging.warning(f"Edit of {pending.message_id} postponed for {e.retry_after}s")
+            self._last_flush[key] = loop.time() + e.retry_after
+            retry = self._pending.get(key, pending)
+            if retry.handle:
+                retry.handle.cancel()
+            retry.handle = loop.call_later(e.retry_after, self._start, key)
+            self._pending[key] = retry
+            return
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                self.failed += 1
+                logging.warning(f"Error while editing message {pending.message_id} - {e}")
+                return
+        except Exception as e:
+            self.failed += 1
+            logging.warning(f"Error while editing message {pending.message_id} - {e}")
+            return
+
+        self.flushed += 1
+        if pending.on_sent:
+            pending.on_sent(text)
+
+    async def flush_all(self) -> None:
+        """Отправить все отложенные правки сразу, например перед остановкой"""
+        for key, pending in list(self._pending.items()):
+            pending.handle.cancel()
+            self._start(key)
+        if self._inflight:
+            await asyncio.wait(list(self._inflight.values()))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requested": self.requested,
+            "collapsed": self.collapsed,
+            "flushed": self.flushed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,88 @@
+import heapq
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from telegram.ext import Application, ContextTypes
+
+from commands.models import get_game, iter_games
+from core.archive import archive_game
+from core.persistence import SQLitePersistence
+from core.shards import owns
+from core.tenants import settings_of
+
+ExpiryEntry = Tuple[datetime, int, int]
+
+
+class ExpiryIndex:
+    """Мин-куча дат игр по всем чатам, отдельная на каждого бота"""
+
+    def __init__(self):
+        self._heaps: Dict[int, List[ExpiryEntry]] = {}
+        self.last_reclaimed = 0
+        self.reclaimed_total = 0
+
+    def push(self, bot_id: int, date: datetime, chat_id: int, message_id: int) -> None:
+        heapq.heappush(self._heaps.setdefault(bot_id, []), (date, chat_id, message_id))
+
+    def pop_expired(self, bot_id: int, before: datetime) -> Iterator[ExpiryEntry]:
+        heap = self._heaps.get(bot_id, [])
+        while heap and heap[0][0] < before:
+            yield heapq.heappop(heap)
+
+    def __len__(self):
+        return sum(len(heap) for heap in self._heaps.values())
+
+
+EXPIRY = ExpiryIndex()
+
+
+def game_dates(application: Application) -> Iterator[Tuple[int, int, datetime]]:
+    """Даты игр своего шарда. Чаты могут быть еще не загружены, поэтому даты берем из базы"""
+    if isinstance(application.persistence, SQLitePersistence):
+        entries = application.persistence.game_dates()
+    else:
+        entries = (
+            (chat_id, message_id, game.date)
+            for chat_id, chat_data in application.chat_data.items()
+            for message_id, game in iter_games(chat_data)
+        )
+    return (entry for entry in entries if owns(entry[0]))
+
+
+def index_games(application: Application) -> int:
+    """Заполнить кучу датами игр"""
+    count = 0
+    for chat_id, message_id, date in game_dates(application):
+        EXPIRY.push(application.bot.id, date, chat_id, message_id)
+        count += 1
+    return count
+
+
+async def sweep_expired(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Удалить прошедшие игры, смотрим только вершину кучи"""
+    application = context.application
+    settings = settings_of(context.bot.id)
+    now_date_without_time = datetime.now(tz=settings.defaults.tz).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    reclaimed = 0
+    chat_ids = set()
+    for date, chat_id, message_id in EXPIRY.pop_expired(context.bot.id, now_date_without_time):
+        chat_data = application.chat_data[chat_id]
+        game = get_game(chat_data, message_id)
+        if game is None or game.date != date:
+            continue
+        archive_game(chat_id, message_id, game, settings.archive)
+        del chat_data[message_id]
+        chat_ids.add(chat_id)
+        reclaimed += 1
+
+    if chat_ids:
+        application.mark_data_for_update_persistence(chat_ids=chat_ids)
+
+    EXPIRY.last_reclaimed = reclaimed
+    EXPIRY.reclaimed_total += reclaimed
+    if reclaimed:
+        logging.info(f"Expired games removed: {reclaimed} in {len(chat_ids)} chats, {len(EXPIRY)} left in index")
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+Response = Tuple[int, bytes, str]
+Handler = Callable[["Request"], Awaitable[Response]]
+
+MAX_BODY_SIZE = 1024 * 1024
+# сколько ждать заголовков и тела запроса, и сколько держать keep-alive соединение без запросов.
+# Без таймаутов зависшие соединения занимают max_connections, и сервер отвечает всем 503
+HEADER_TIMEOUT = 10
+BODY_TIMEOUT = 30
+IDLE_TIMEOUT = 60
+
+
+class Request:
+    __slots__ = ("method", "path", "headers", "body")
+
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+class HTTPServer:
+    """Минимальный HTTP/1.1 сервер на asyncio для вебхука, health и метрик"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int = 40,
+        header_timeout: float = HEADER_TIMEOUT,
+        body_timeout: float = BODY_TIMEOUT,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.timed_out = 0
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        # маршруты, которые отвечают и сверх max_connections, например /health
+        self._uncapped: Set[Tuple[str, str]] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str, handler: Handler, capped: bool = True) -> None:
+        self._routes[(method, path)] = handler
+        if not capped:
+            self._uncapped.add((method, path))
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logging.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # сверх лимита соединение обслуживает один запрос: маршруты вне лимита отвечают, остальные - 503
+        over_limit = self.connections >= self.max_connections
+        if not over_limit:
+            self.connections += 1
+        try:
+            while True:
+                request = await self._read(reader)
+                if request is None:
+                    break
+                if over_limit and (request.method, request.path) not in self._uncapped:
+                    await self._write(writer, (HTTPStatus.SERVICE_UNAVAILABLE, b"", "text/plain"), keep_alive=False)
+                    break
+                response = await self._handle(request)
+                keep_alive = not over_limit and request.headers.get("connection", "").lower() != "close"
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            if not over_limit:
+                self.connections -= 1
+            writer.close()
+
+    async def _handle(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, b"", "text/plain"
+        try:
+            return await handler(request)
+        except Exception as e:
+            logging.exception(f"Error while handling {request.method} {request.path} - {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, b"", "text/plain"
+
+    async def _read(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """Следующий запрос соединения, None - клиент закрыл его или молчал дольше idle_timeout"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        except asyncio.TimeoutError:
+            return None
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = await asyncio.wait_for(self._read_headers(reader), self.header_timeout)
+
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_SIZE:
+            raise ValueError("Request body too large")
+        body = await asyncio.wait_for(reader.readexactly(length), self.body_timeout) if length else b""
+        return Request(method, target.split("?", 1)[0], headers, body)
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        status, body, content_type = response
+        status = HTTPStatus(status)
+        writer.write(
+            (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            ).encode("latin-1")
+            + body
+        )
+        await writer.drain()
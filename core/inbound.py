@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Set, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, BaseHandler, ContextTypes
+
+from commands.consts import CALLBACK_DEDUP_SECONDS, SHED_BACKLOG
+from core.metrics import CALLBACKS_DROPPED
+
+# (user_id, chat_id, message_id, data) нажатия кнопки
+CallbackKey = Tuple[int, int, int, str]
+# кнопки, повторное нажатие которых ничего не меняет. "+1"/"-1" жмут несколько раз подряд
+# намеренно, по гостю за нажатие, их повторы не схлопываются
+IDEMPOTENT_CALLBACKS = frozenset({"i", "not_sure", "not_play", "check_not_sure"})
+
+
+class CallbackGuard:
+    """Разбор нажатий кнопок до хендлеров. Повтор того же нажатия тем же пользователем
+    на том же сообщении в пределах window сразу отвечается и не обрабатывается,
+    если кнопка из IDEMPOTENT_CALLBACKS.
+    Когда необработанных обновлений больше max_backlog, нажатия сразу отвечаются
+    "попробуйте еще раз": пока до них дойдет очередь, пользователь уже ушел"""
+
+    def __init__(self, window: float = 1, max_backlog: int = 0):
+        self.window = window
+        self.max_backlog = max_backlog
+        # по порядку нажатия, поэтому устаревшие записи всегда в начале
+        self._seen: "OrderedDict[CallbackKey, float]" = OrderedDict()
+        self._answers: Set[asyncio.Task] = set()
+        self.duplicates = 0
+        self.shed = 0
+
+    def _forget_old(self, now: float) -> None:
+        while self._seen and now - next(iter(self._seen.values())) >= self.window:
+            self._seen.popitem(last=False)
+
+    def is_duplicate(self, update: Update) -> bool:
+        if not self.window:
+            return False
+        query = update.callback_query
+        if query.message is None or query.data not in IDEMPOTENT_CALLBACKS:
+            return False
+        now = time.monotonic()
+        self._forget_old(now)
+        key = (query.from_user.id, query.message.chat_id, query.message.message_id, query.data)
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        return False
+
+    def drop(self, application: Application, update: Update) -> bool:
+        """Нажатие отвечено здесь и в хендлеры не идет"""
+        if update.callback_query is None:
+            return False
+        if self.max_backlog and backlog(application) > self.max_backlog:
+            self.shed += 1
+            CALLBACKS_DROPPED.inc("shed")
+            self._answer(update, "Бот перегружен, нажмите еще раз чуть позже")
+            return True
+        if self.is_duplicate(update):
+            self.duplicates += 1
+            CALLBACKS_DROPPED.inc("duplicate")
+            self._answer(update, "Уже учтено")
+            return True
+        return False
+
+    def _answer(self, update: Update, text: str) -> None:
+        task = asyncio.create_task(update.callback_query.answer(text=text))
+        self._answers.add(task)
+        task.add_done_callback(self._answer_done)
+
+    def _answer_done(self, task: asyncio.Task) -> None:
+        self._answers.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.warning(f"Error while answering dropped callback - {task.exception()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self._seen), "duplicates": self.duplicates, "shed": self.shed}
+
+
+CALLBACKS = CallbackGuard(window=CALLBACK_DEDUP_SECONDS, max_backlog=SHED_BACKLOG)
+
+
+def backlog(application: Application) -> int:
+    """Обновления, полученные, но еще не обработанные: в очереди и ждущие обработки
+    при CONCURRENT_UPDATES. PTB отмечает task_done только после обработки"""
+    queue = application.update_queue
+    return getattr(queue, "_unfinished_tasks", queue.qsize())
+
+
+class CallbackGuardHandler(BaseHandler):
+    """Как AccessHandler: отброшенное нажатие останавливает обработку в check_update,
+    контекст и chat_data не строятся. Ставится в группу -1 после AccessHandler"""
+
+    def __init__(self, guard: CallbackGuard, application: Application):
+        super().__init__(self._never_called)
+        self.guard = guard
+        self.application = application
+
+    def check_update(self, update: object) -> None:
+        if isinstance(update, Update) and self.guard.drop(self.application, update):
+            raise ApplicationHandlerStop
+        return None
+
+    @staticmethod
+    async def _never_called(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        pass
@@ -0,0 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, Tuple
+
+
+class KeyedLocks:
+    """asyncio.Lock по ключу. Лок существует, пока его кто-то держит или ждет"""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key) or (asyncio.Lock(), 0)
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def locked(self, key: Hashable) -> bool:
+        return key in self._locks
+
+    def __len__(self):
+        return len(self._locks)
+
+
+GAME_LOCKS = KeyedLocks()
+CHAT_LOCKS = KeyedLocks()
+
+
+def game_lock(chat_id: int, message_id: int):
+    """Лок на список участников и поля одной игры"""
+    return GAME_LOCKS.hold((chat_id, message_id))
+
+
+def chat_lock(chat_id: int):
+    """Лок на общие данные чата, например custom_names"""
+    return CHAT_LOCKS.hold(chat_id)
@@ -0,0 +1,267 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from telegram.error import TelegramError
+from telegram.ext import Application, ApplicationHandlerStop
+from telegram.request import BaseRequest
+
+from core.http import HTTPServer, Request, Response
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOOP_LAG_INTERVAL = 0.5
+
+Labels = Tuple[str, ...]
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # по меткам: счетчики попаданий в каждый бакет (+Inf последний), сумма
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels + ('le',), labels + (bound,))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {total[0]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Метрики процесса. Запись - обновление словаря, текст собирается только при запросе"""
+
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self.collectors: List[Callable[[], List[str]]] = []
+        # по префиксу: источники stats() и их постоянные метки
+        self.stats: Dict[str, List[Tuple[Dict[str, Any], Callable[[], Dict[str, Any]]]]] = {}
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), **kwargs) -> Histogram:
+        metric = Histogram(name, help, labels, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def register_stats(
+        self, prefix: str, stats: Callable[[], Dict[str, Any]], labels: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Отдавать числа из stats() как gauge, вложенные словари - с меткой key.
+        labels - метки источника, источники с одним prefix (боты процесса) отдаются одной семьей"""
+        self.stats.setdefault(prefix, []).append((labels or {}, stats))
+
+    @staticmethod
+    def _render_stats(prefix: str, sources: List[Tuple[Dict[str, Any], Callable[[], Dict[str, Any]]]]) -> List[str]:
+        samples: Dict[str, List[str]] = {}
+        for labels, stats in sources:
+            names, values = tuple(labels), tuple(labels.values())
+            for name, value in stats().items():
+                metric = f"{prefix}_{name}"
+                if isinstance(value, dict):
+                    samples.setdefault(metric, []).extend(
+                        f"{metric}{format_labels(names + ('key',), values + (key,))} {v}" for key, v in value.items()
+                    )
+                elif isinstance(value, (int, float)):
+                    samples.setdefault(metric, []).append(f"{metric}{format_labels(names, values)} {value}")
+        lines = []
+        for metric, metric_samples in samples.items():
+            lines += [f"# TYPE {metric} gauge", *metric_samples]
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        collectors = [functools.partial(self._render_stats, prefix, sources) for prefix, sources in self.stats.items()]
+        for collect in collectors + self.collectors:
+            try:
+                lines += collect()
+            except Exception as e:
+                logging.warning(f"Error while collecting metrics - {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+HANDLER_SECONDS = REGISTRY.histogram("bot_handler_seconds", "Handler latency", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Handler exceptions", ("handler",))
+API_SECONDS = REGISTRY.histogram("bot_api_request_seconds", "Bot API call latency", ("method",))
+API_ERRORS = REGISTRY.counter(
+    "bot_api_errors_total", "Bot API errors, error=RetryAfter is 429", ("method", "error")
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "bot_event_loop_lag_seconds", "Event loop lag", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+)
+ACCESS_REJECTED = REGISTRY.counter(
+    "bot_access_rejected_total", "Updates dropped from chats not in ALLOWED_CHAT_IDS", ("chat", "kind")
+)
+CALLBACKS_DROPPED = REGISTRY.counter(
+    "bot_callbacks_dropped_total", "Button presses answered before handlers, reason=duplicate|shed", ("reason",)
+)
+PERSISTENCE_WRITE_SECONDS = REGISTRY.histogram(
+    "bot_persistence_write_seconds", "Database transaction of one flush, runs in the writer thread"
+)
+PERSISTENCE_FLUSH_STALL_SECONDS = REGISTRY.histogram(
+    "bot_persistence_flush_stall_seconds", "Event loop time spent snapshotting changed chats per flush"
+)
+
+
+def instrumented(callback, name: str):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+def instrument_handlers(application: Application) -> None:
+    """Обернуть колбэки всех зарегистрированных хендлеров замером времени"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = instrumented(handler.callback, handler.callback.__name__)
+
+
+class InstrumentedRequest(BaseRequest):
+    """Обертка над запросами к Bot API: время и ошибки по методу"""
+
+    def __init__(self, request: BaseRequest):
+        self.request = request
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.request.read_timeout
+
+    async def initialize(self) -> None:
+        await self.request.initialize()
+
+    async def shutdown(self) -> None:
+        await self.request.shutdown()
+
+    async def post(self, url: str, *args, **kwargs):
+        method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().post(url, *args, **kwargs)
+        except TelegramError as e:
+            API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method)
+
+    async def do_request(self, *args, **kwargs) -> Tuple[int, bytes]:
+        return await self.request.do_request(*args, **kwargs)
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
+
+
+def chat_games(applications: Dict[str, Application]) -> List[str]:
+    """Игры и участники по чатам всех ботов процесса, по семье метрик на все боты"""
+    from commands.models import iter_games
+
+    lines = ["# TYPE bot_games gauge"]
+    participants = ["# TYPE bot_participants gauge"]
+    for bot, application in list(applications.items()):
+        for chat_id, chat_data in list(application.chat_data.items()):
+            games = list(iter_games(chat_data))
+            labels = format_labels(("bot", "chat_id"), (bot, chat_id))
+            lines.append(f"bot_games{labels} {len(games)}")
+            participants.append(f"bot_participants{labels} {sum(len(game) for _, game in games)}")
+    return lines + participants
+
+
+class MetricsServer:
+    """GET /metrics в формате Prometheus"""
+
+    def __init__(self, listen: str, port: int):
+        self.http = HTTPServer(listen, port)
+        self.http.route("GET", "/metrics", self._handle_metrics)
+        self._lag_task: Optional[asyncio.Task] = None
+        self.applications: Dict[str, Application] = {}
+        REGISTRY.collectors.append(functools.partial(chat_games, self.applications))
+
+    def watch(self, application: Application, bot: str) -> None:
+        """Метрики бота с меткой bot: игры по чатам, очередь исходящих, загруженные чаты.
+        При BOTS_CONFIG вызывается для каждого бота процесса"""
+        self.applications[bot] = application
+        if hasattr(application.bot.rate_limiter, "stats"):
+            REGISTRY.register_stats("bot_outbound", application.bot.rate_limiter.stats, {"bot": bot})
+        if hasattr(application, "chat_store"):
+            REGISTRY.register_stats("bot_chats", application.chat_store.stats, {"bot": bot})
+
+    async def _handle_metrics(self, request: Request) -> Response:
+        return HTTPStatus.OK, REGISTRY.render().encode(), "text/plain; version=0.0.4"
+
+    async def start(self) -> None:
+        await self.http.start()
+        self._lag_task = asyncio.create_task(monitor_loop_lag())
+
+    async def stop(self) -> None:
+        if self._lag_task:
+            self._lag_task.cancel()
+            self._lag_task = None
+        await self.http.stop()
@@ -0,0 +1,262 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+
+class Priority(IntEnum):
+    CALLBACK = 0
+    EDIT = 1
+    REPLY = 2
+    INFO = 3
+
+
+ENDPOINT_PRIORITY = {
+    "answerCallbackQuery": Priority.CALLBACK,
+    "editMessageText": Priority.EDIT,
+    "editMessageReplyMarkup": Priority.EDIT,
+    "deleteMessage": Priority.EDIT,
+}
+
+# общий лимит Bot API на бота, сообщений в секунду
+OVERALL_MAX_RATE = 30
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, capacity: float, period: float, now: float):
+        self.rate = capacity / period
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд можно будет взять токен, 0 - можно сейчас"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+
+class Waiter:
+    __slots__ = ("priority", "seq", "chat_id", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, chat_id: Optional[int], future: asyncio.Future, enqueued_at: float):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+    def __lt__(self, other: "Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundLimiter(BaseRateLimiter[int]):
+    """Единая очередь исходящих запросов к Bot API: общий лимит и лимит на чат,
+    приоритеты (ответы на кнопки первыми, информационные сообщения последними),
+    автоматический повтор после RetryAfter"""
+
+    def __init__(
+        self,
+        overall_max_rate: float = OVERALL_MAX_RATE,
+        overall_time_period: float = 1,
+        group_max_rate: float = 20,
+        group_time_period: float = 60,
+        private_max_rate: float = 1,
+        private_time_period: float = 1,
+        max_retries: int = 3,
+    ):
+        self.overall = (overall_max_rate, overall_time_period)
+        self.group = (group_max_rate, group_time_period)
+        self.private = (private_max_rate, private_time_period)
+        self.max_retries = max_retries
+
+        self._global: Optional[TokenBucket] = None
+        self._chats: Dict[int, TokenBucket] = {}
+        # куча по (priority, seq): следующий на выдачу всегда первый
+        self._ready: List[Waiter] = []
+        # ждущие токена своего чата, по чатам, и куча (когда у чата будет токен, chat_id)
+        self._parked: Dict[int, List[Waiter]] = {}
+        self._unpark: List[Tuple[float, int]] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._pump: Optional[asyncio.Task] = None
+
+        self.granted = 0
+        self.retried = 0
+        self.max_queue_depth = 0
+        self.wait_total: Dict[int, float] = {priority: 0.0 for priority in Priority}
+        self.wait_max: Dict[int, float] = {priority: 0.0 for priority in Priority}
+        self.granted_by_priority: Dict[int, int] = {priority: 0 for priority in Priority}
+
+    async def initialize(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._global = TokenBucket(*self.overall, now=loop.time())
+        self._wakeup = asyncio.Event()
+        self._pump = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._pump:
+            self._pump.cancel()
+            try:
+                await self._pump
+            except asyncio.CancelledError:
+                pass
+            self._pump = None
+        for waiter in itertools.chain(self._ready, *self._parked.values()):
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+        self._ready.clear()
+        self._parked.clear()
+        self._unpark.clear()
+        self._queued = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            capacity, period = self.group if chat_id < 0 else self.private
+            bucket = self._chats[chat_id] = TokenBucket(capacity, period, now)
+        return bucket
+
+    def _park(self, waiter: Waiter, ready_at: float) -> None:
+        """Отложить запрос, пока у его чата нет токена: он не мешает выдаче другим чатам"""
+        parked = self._parked.get(waiter.chat_id)
+        if parked is None:
+            parked = self._parked[waiter.chat_id] = []
+            heapq.heappush(self._unpark, (ready_at, waiter.chat_id))
+        heapq.heappush(parked, waiter)
+
+    def _release(self, now: float) -> None:
+        """Вернуть в очередь запросы чатов, у которых появился токен"""
+        while self._unpark and self._unpark[0][0] <= now:
+            _, chat_id = heapq.heappop(self._unpark)
+            for waiter in self._parked.pop(chat_id, ()):
+                heapq.heappush(self._ready, waiter)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self._release(now)
+            if not self._ready:
+                if self._unpark:
+                    await self._sleep(self._unpark[0][0] - now)
+                else:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                continue
+
+            global_wait = self._global.wait_time(now)
+            if global_wait:
+                await self._sleep(global_wait)
+                continue
+
+            waiter = heapq.heappop(self._ready)
+            if waiter.future.done():
+                self._queued -= 1
+                continue
+            bucket = self._chat_bucket(waiter.chat_id, now) if waiter.chat_id is not None else None
+            if bucket is not None and (waiter.chat_id in self._parked or bucket.wait_time(now)):
+                # пока у чата есть отложенные, новые запросы встают за ними по приоритету
+                self._park(waiter, now + bucket.wait_time(now))
+                continue
+
+            self._global.take()
+            if bucket:
+                bucket.take()
+            self._queued -= 1
+            self._grant(waiter, now)
+
+            if len(self._chats) > 1000:
+                self._chats = {chat_id: bucket for chat_id, bucket in self._chats.items() if not bucket.is_idle(now)}
+
+    async def _sleep(self, delay: float) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _grant(self, waiter: Waiter, now: float) -> None:
+        waited = now - waiter.enqueued_at
+        self.granted += 1
+        self.granted_by_priority[waiter.priority] += 1
+        self.wait_total[waiter.priority] += waited
+        self.wait_max[waiter.priority] = max(self.wait_max[waiter.priority], waited)
+        waiter.future.set_result(None)
+
+    async def _acquire(self, priority: int, chat_id: Optional[int]) -> None:
+        loop = asyncio.get_running_loop()
+        waiter = Waiter(priority, next(self._seq), chat_id, loop.create_future(), loop.time())
+        heapq.heappush(self._ready, waiter)
+        self._queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queued)
+        self._wakeup.set()
+        await waiter.future
+
+    def _block(self, chat_id: Optional[int], retry_after: float) -> None:
+        now = asyncio.get_running_loop().time()
+        bucket = self._chat_bucket(chat_id, now) if chat_id is not None else self._global
+        bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+        self._wakeup.set()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        priority = rate_limit_args if rate_limit_args is not None else ENDPOINT_PRIORITY.get(endpoint, Priority.REPLY)
+        chat_id = data.get("chat_id")
+        if endpoint == "answerCallbackQuery" or not isinstance(chat_id, int):
+            chat_id = None
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                logging.warning(f"{endpoint} to {chat_id} hit flood limit, retry in {e.retry_after}s")
+                self._block(chat_id, e.retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "granted": self.granted,
+            "retried": self.retried,
+            "wait_avg": {
+                Priority(priority).name: self.wait_total[priority] / count
+                for priority, count in self.granted_by_priority.items()
+                if count
+            },
+            "wait_max": {Priority(priority).name: wait for priority, wait in self.wait_max.items() if wait},
+        }
@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from commands.consts import TZ
+from commands.models import Game, Participant, is_legacy_game, legacy_name
+from core.metrics import PERSISTENCE_FLUSH_STALL_SECONDS, PERSISTENCE_WRITE_SECONDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    user_message TEXT NOT NULL,
+    author INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    max_players_count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS participants (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (chat_id, message_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS custom_names (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chat_extra (
+    chat_id INTEGER NOT NULL,
+    key BLOB NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (chat_id, key)
+) WITHOUT ROWID;
+"""
+
+GameRow = Tuple[Any, ...]
+ParticipantRows = Tuple[Tuple[Any, ...], ...]
+
+
+def is_game(key, value) -> bool:
+    return (isinstance(key, int) and isinstance(value, Game)) or is_legacy_game(key, value)
+
+
+def game_to_rows(game: Game) -> Tuple[GameRow, ParticipantRows]:
+    if not isinstance(game, Game):
+        game = Game.from_legacy(game)
+    if game.rows_cache is not None and game.rows_cache[0] == game.version:
+        return game.rows_cache[1]
+    game_row = (
+        game.date.isoformat(),
+        game.user_message,
+        game.author,
+        game.price,
+        game.hour,
+        game.max_players_count,
+    )
+    participants = tuple(
+        (position, user.user_id, user.name, user.type)
+        for position, user in enumerate(game.participants)
+    )
+    game.rows_cache = (game.version, (game_row, participants))
+    return game_row, participants
+
+
+def date_from_row(date_text: str, tz: ZoneInfo = TZ) -> datetime:
+    # время на часах, смещение могло быть записано с ошибкой (LMT от pytz)
+    return datetime.fromisoformat(date_text).replace(tzinfo=tz)
+
+
+def rows_to_game(game_row: GameRow, participants, tz: ZoneInfo = TZ) -> Game:
+    date_text, user_message, author, price, hour, max_players_count = game_row
+    game = Game(
+        date=date_from_row(date_text, tz),
+        user_message=user_message,
+        author=author,
+        price=price,
+        hour=hour,
+        max_players_count=max_players_count,
+    )
+    for _, user_id, name, user_type in participants:
+        game.append(Participant(user_id, user_type, legacy_name(name)))
+    return game
+
+
+class ChatSnapshot:
+    """Состояние чата строками для базы: неизменяемые кортежи, которые можно
+    отдать в поток записи, пока хендлеры дальше меняют chat_data"""
+
+    __slots__ = ("games", "custom_names", "extra")
+
+    def __init__(self):
+        self.games: Dict[int, Tuple[GameRow, ParticipantRows]] = {}
+        self.custom_names: Dict[int, str] = {}
+        self.extra: Dict[bytes, bytes] = {}
+
+    @classmethod
+    def of(cls, data: dict) -> "ChatSnapshot":
+        snapshot = cls()
+        for key, value in data.items():
+            if is_game(key, value):
+                snapshot.games[key] = game_to_rows(value)
+            elif key == "custom_names" and isinstance(value, dict):
+                snapshot.custom_names = dict(value)
+            else:
+                snapshot.extra[pickle.dumps(key)] = pickle.dumps(value)
+        return snapshot
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранит chat_data в SQLite построчно и пишет только изменившиеся игры.
+    На event loop только снимок строк, сравнение и запись - в отдельном потоке
+    со своим соединением, все чаты одного сохранения - одной транзакцией"""
+
+    def __init__(self, filepath: str, update_interval: float = 60, tz: ZoneInfo = TZ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.filepath = filepath
+        # даты хранятся временем на часах, пояс - бота
+        self.tz = tz
+        # при lazy чаты не читаются при старте, а загружаются по одному через load_chat
+        self.lazy = False
+        self._snapshots: Dict[int, ChatSnapshot] = {}
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        # чтения идут через _conn на event loop, запись - через _writer в потоке
+        self._writer = self._connect()
+        self._write_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.filepath, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load_all(self) -> Dict[int, dict]:
+        return self._load()
+
+    def load_chat(self, chat_id: int) -> dict:
+        """Данные одного чата, пустой dict если чата нет в базе"""
+        self._snapshots.pop(chat_id, None)
+        return self._load("WHERE chat_id = ?", (chat_id,)).get(chat_id, {})
+
+    def forget_chat(self, chat_id: int) -> None:
+        """Выгрузить снимок чата из памяти, в следующий раз он прочитается из базы"""
+        self._snapshots.pop(chat_id, None)
+
+    def game_dates(self) -> Iterator[Tuple[int, int, datetime]]:
+        for chat_id, message_id, date_text in self._conn.execute("SELECT chat_id, message_id, date FROM games"):
+            yield chat_id, message_id, date_from_row(date_text, self.tz)
+
+    def _load(self, where: str = "", params: tuple = ()) -> Dict[int, dict]:
+        chats: Dict[int, dict] = {}
+        participants: Dict[Tuple[int, int], list] = {}
+        for row in self._conn.execute(
+            "SELECT chat_id, message_id, position, user_id, username, type "
+            f"FROM participants {where} ORDER BY chat_id, message_id, position",
+            params,
+        ):
+            participants.setdefault((row[0], row[1]), []).append(row[2:])
+
+        for chat_id, message_id, *game_row in self._conn.execute(
+            "SELECT chat_id, message_id, date, user_message, author, price, hour, max_players_count "
+            f"FROM games {where}",
+            params,
+        ):
+            users = tuple(participants.get((chat_id, message_id), ()))
+            chats.setdefault(chat_id, {})[message_id] = rows_to_game(tuple(game_row), users, self.tz)
+            self._snapshot(chat_id).games[message_id] = (tuple(game_row), users)
+
+        for chat_id, user_id, name in self._conn.execute(
+            f"SELECT chat_id, user_id, name FROM custom_names {where}", params
+        ):
+            chats.setdefault(chat_id, {}).setdefault("custom_names", {})[user_id] = name
+            self._snapshot(chat_id).custom_names[user_id] = name
+
+        for chat_id, key, value in self._conn.execute(f"SELECT chat_id, key, value FROM chat_extra {where}", params):
+            chats.setdefault(chat_id, {})[pickle.loads(key)] = pickle.loads(value)
+            self._snapshot(chat_id).extra[key] = value
+
+        return chats
+
+    def write_chat(self, chat_id: int, data: dict) -> int:
+        """Записать изменения чата сразу, возвращает кол-во затронутых строк"""
+        return self.write_snapshots({chat_id: ChatSnapshot.of(data)})
+
+    def write_snapshots(self, snapshots: Dict[int, ChatSnapshot], deleted: Iterable[int] = ()) -> int:
+        """Записать снимки чатов и удалить чаты одной транзакцией: один коммит
+        (и одна синхронизация WAL) на сохранение, при сбое не остается половины чатов"""
+        started = time.perf_counter()
+        with self._write_lock, self._writer:
+            changed = sum(self._write_rows(chat_id, snapshot) for chat_id, snapshot in snapshots.items())
+            for chat_id in deleted:
+                for table in ("games", "participants", "custom_names", "chat_extra"):
+                    self._writer.execute(f"DELETE FROM {table} WHERE chat_id = ?", (chat_id,))
+        # снимки меняем только после коммита, иначе после ошибки изменения бы потерялись
+        self._snapshots.update(snapshots)
+        for chat_id in deleted:
+            self._snapshots.pop(chat_id, None)
+        PERSISTENCE_WRITE_SECONDS.observe(time.perf_counter() - started)
+        return changed
+
+    def _write_rows(self, chat_id: int, new: ChatSnapshot) -> int:
+        old = self._snapshots.get(chat_id) or ChatSnapshot()
+        changed_games = [
+            (message_id, rows) for message_id, rows in new.games.items() if old.games.get(message_id) != rows
+        ]
+        removed_games = [message_id for message_id in old.games if message_id not in new.games]
+        changed_names = [
+            (user_id, name) for user_id, name in new.custom_names.items() if old.custom_names.get(user_id) != name
+        ]
+        removed_names = [user_id for user_id in old.custom_names if user_id not in new.custom_names]
+        changed_extra = [(key, value) for key, value in new.extra.items() if old.extra.get(key) != value]
+        removed_extra = [key for key in old.extra if key not in new.extra]
+
+        conn = self._writer
+        for message_id in removed_games + [message_id for message_id, _ in changed_games]:
+            conn.execute("DELETE FROM participants WHERE chat_id = ? AND message_id = ?", (chat_id, message_id))
+        conn.executemany(
+            "DELETE FROM games WHERE chat_id = ? AND message_id = ?",
+            [(chat_id, message_id) for message_id in removed_games],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(chat_id, message_id, *game_row) for message_id, (game_row, _) in changed_games],
+        )
+        conn.executemany(
+            "INSERT INTO participants VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (chat_id, message_id, *user)
+                for message_id, (_, users) in changed_games
+                for user in users
+            ],
+        )
+        conn.executemany(
+            "DELETE FROM custom_names WHERE chat_id = ? AND user_id = ?",
+            [(chat_id, user_id) for user_id in removed_names],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO custom_names VALUES (?, ?, ?)",
+            [(chat_id, user_id, name) for user_id, name in changed_names],
+        )
+        conn.executemany(
+            "DELETE FROM chat_extra WHERE chat_id = ? AND key = ?",
+            [(chat_id, key) for key in removed_extra],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO chat_extra VALUES (?, ?, ?)",
+            [(chat_id, key, value) for key, value in changed_extra],
+        )
+        return (
+            len(changed_games) + len(removed_games) + len(changed_names)
+            + len(removed_names) + len(changed_extra) + len(removed_extra)
+        )
+
+    def delete_chat(self, chat_id: int):
+        self.write_snapshots({}, (chat_id,))
+
+    async def save_chats(self, chats: Dict[int, dict], deleted: Iterable[int] = ()) -> int:
+        """Снять снимки чатов на event loop (время пишется в PERSISTENCE_FLUSH_STALL_SECONDS)
+        и записать их в потоке, пока бот обрабатывает следующие обновления"""
+        started = time.perf_counter()
+        snapshots = {chat_id: ChatSnapshot.of(data) for chat_id, data in chats.items()}
+        deleted = tuple(deleted)
+        PERSISTENCE_FLUSH_STALL_SECONDS.observe(time.perf_counter() - started)
+        if not snapshots and not deleted:
+            return 0
+        changed = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.write_snapshots, snapshots, deleted
+        )
+        if changed:
+            logging.debug(f"Saved {len(snapshots)} chats, {changed} rows changed")
+        return changed
+
+    def _snapshot(self, chat_id: int) -> ChatSnapshot:
+        if chat_id not in self._snapshots:
+            self._snapshots[chat_id] = ChatSnapshot()
+        return self._snapshots[chat_id]
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {} if self.lazy else self.load_all()
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self.save_chats({chat_id: data})
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self.save_chats({}, (chat_id,))
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """PTB вызывает при shutdown: дождаться записей, уже отданных потоку, и закрыть соединения"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_writer)
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+    def _close_writer(self) -> None:
+        with self._write_lock:
+            self._writer.commit()
+            self._writer.close()
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    """Читает старые pickle без pytz: зоны pytz заменяются на ZoneInfo, время на часах сохраняется"""
+
+    def find_class(self, module: str, name: str):
+        if module == "pytz" and name == "_p":
+            return lambda zone, *args: ZoneInfo(zone)
+        if module == "pytz" and name == "_UTC":
+            return lambda: timezone.utc
+        return super().find_class(module, name)
+
+
+def load_legacy_pickle(pickle_path: str) -> dict:
+    with open(pickle_path, "rb") as f:
+        return LegacyUnpickler(f).load()
+
+
+def migrate_pickle(pickle_path: str, persistence: SQLitePersistence) -> int:
+    """Перенести chat_data из файла PicklePersistence в SQLite, возвращает кол-во чатов"""
+    data = load_legacy_pickle(pickle_path)
+
+    chat_data = data.get("chat_data") or {}
+    for chat_id, chat in chat_data.items():
+        persistence.write_chat(chat_id, chat)
+    return len(chat_data)
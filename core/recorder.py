@@ -0,0 +1,205 @@
+"""Запись входящих обновлений для воспроизведения нагрузки (bench/replay.py).
+
+Пишется gzip JSONL, по строке на событие:
+    {"at": время, "update": {...}} - команда или нажатие кнопки
+    {"at": время, "sent": [chat_id, message_id]} - бот отправил сообщение с кнопками,
+        по этим id при воспроизведении нажатия попадают в те же игры
+
+Пишутся только поля, которые читают хендлеры. id пользователей и чатов заменяются
+хэшем с солью, имена - на User<id>, аргументы /mynameis не сохраняются.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+from http import HTTPStatus
+from typing import IO, Optional, Tuple
+
+from telegram import Message, Update, User
+from telegram.ext import BaseHandler, ContextTypes
+from telegram.request import BaseRequest
+
+from commands.consts import RECORD_SALT, RECORD_UPDATES
+
+# сколько строк держать в буфере gzip до сброса на диск
+FLUSH_EVERY = 100
+# автор сообщений бота в записи, при воспроизведении подставляется фейковый бот
+BOT_ID = 0
+
+
+class UpdateRecorder:
+    def __init__(self, path: str, salt: str = ""):
+        self.path = path
+        # без соли из env у каждого запуска своя, id разных записей не сопоставить
+        self._salt = (salt or secrets.token_hex(16)).encode()
+        self._file: Optional[IO[bytes]] = None
+        self._unflushed = 0
+        self.bot_id: Optional[int] = None
+        self.recorded = 0
+        self.sent = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _pseudo(self, value: int) -> int:
+        digest = hashlib.blake2b(str(value).encode(), key=self._salt, digest_size=5).digest()
+        return int.from_bytes(digest, "big") + 1
+
+    def chat_id(self, chat_id: int) -> int:
+        # знак сохраняется: по нему бот отличает группы от личных чатов
+        return -(10 ** 12 + self._pseudo(chat_id)) if chat_id < 0 else self._pseudo(chat_id)
+
+    def _user(self, user: Optional[User]) -> dict:
+        if user is None or user.id == self.bot_id:
+            return {"id": BOT_ID, "is_bot": True, "first_name": "Bot"}
+        user_id = self._pseudo(user.id)
+        return {"id": user_id, "is_bot": user.is_bot, "first_name": f"User{user_id}"}
+
+    def _chat(self, message: Message) -> dict:
+        return {"id": self.chat_id(message.chat_id), "type": message.chat.type}
+
+    def _message(self, message: Message) -> dict:
+        data = {
+            "message_id": message.message_id,
+            "date": int(message.date.timestamp()),
+            "chat": self._chat(message),
+            "from": self._user(message.from_user),
+        }
+        text = message.text or ""
+        command = text.split(maxsplit=1)[0] if text.startswith("/") else ""
+        if command:
+            if command.split("@")[0] == "/mynameis" and command != text:
+                text = f"{command} Игрок"
+            data["text"] = text
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return data
+
+    def anonymize(self, update: Update) -> Optional[dict]:
+        """Обновление без личных данных, None - такие обновления бот не обрабатывает"""
+        if update.callback_query and update.callback_query.message:
+            query = update.callback_query
+            return {
+                "update_id": update.update_id,
+                "callback_query": {
+                    "id": str(update.update_id),
+                    "from": self._user(query.from_user),
+                    "chat_instance": str(self.chat_id(query.message.chat_id)),
+                    "data": query.data,
+                    "message": self._message(query.message),
+                },
+            }
+        message = update.message
+        if message is None or not (message.text or "").startswith("/"):
+            return None
+        data = self._message(message)
+        if message.reply_to_message:
+            data["reply_to_message"] = self._message(message.reply_to_message)
+        return {"update_id": update.update_id, "message": data}
+
+    def _write(self, event: dict) -> None:
+        if self._file is None:
+            # дописываем новым членом gzip, записи разных запусков читаются подряд
+            self._file = gzip.open(self.path, "ab")
+        event["at"] = round(time.time(), 3)
+        self._file.write(json.dumps(event, ensure_ascii=False).encode() + b"\n")
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def record(self, update: Update) -> None:
+        try:
+            data = self.anonymize(update)
+            if data is not None:
+                self._write({"update": data})
+                self.recorded += 1
+        except Exception as e:
+            logging.warning(f"Error while recording update {update.update_id} - {e}")
+
+    def record_sent(self, chat_id: int, message_id: int) -> None:
+        try:
+            self._write({"sent": [self.chat_id(chat_id), message_id]})
+            self.sent += 1
+        except Exception as e:
+            logging.warning(f"Error while recording sent message {message_id} - {e}")
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            self._unflushed = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        return {"recorded": self.recorded, "sent": self.sent}
+
+
+class RecorderHandler(BaseHandler):
+    """Как AccessHandler: пишет обновление в check_update и никогда не срабатывает.
+    Ставится в группу -1 после AccessHandler, чтобы писались только разрешенные чаты"""
+
+    def __init__(self, recorder: UpdateRecorder):
+        super().__init__(self._never_called)
+        self.recorder = recorder
+
+    def check_update(self, update: object) -> None:
+        if isinstance(update, Update):
+            self.recorder.record(update)
+        return None
+
+    @staticmethod
+    async def _never_called(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        pass
+
+
+class RecordingRequest(BaseRequest):
+    """Обертка над запросами к Bot API: запоминает id отправленных сообщений с кнопками
+    (списки игр), иначе при воспроизведении нажатия не найдут свои игры"""
+
+    def __init__(self, request: BaseRequest, recorder: UpdateRecorder):
+        self.request = request
+        self.recorder = recorder
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.request.read_timeout
+
+    async def initialize(self) -> None:
+        await self.request.initialize()
+
+    async def shutdown(self) -> None:
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs) -> Tuple[int, bytes]:
+        # запись в do_request, а не в post: внешние обертки (InstrumentedRequest) вызывают
+        # у вложенного запроса только do_request
+        code, payload = await self.request.do_request(url, method, request_data, *args, **kwargs)
+        if (
+            code == HTTPStatus.OK
+            and url.endswith("/sendMessage")
+            and request_data is not None
+            and "reply_markup" in request_data.parameters
+        ):
+            try:
+                result = json.loads(payload)["result"]
+                self.recorder.record_sent(result["chat"]["id"], result["message_id"])
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Error while recording sent message - {e}")
+        return code, payload
+
+
+def recording_path(path: str, shard: Optional[int]) -> str:
+    """У каждого воркера шарда свой файл: gzip из нескольких процессов в один файл не пишется"""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path[:-3] if path.endswith(".gz") else path)
+    return f"{root}.{shard}{ext}" + (".gz" if path.endswith(".gz") else "")
+
+
+RECORDER = UpdateRecorder(RECORD_UPDATES, RECORD_SALT)
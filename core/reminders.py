@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from telegram.constants import ParseMode
+from telegram.ext import Application, ContextTypes
+
+from commands.common import not_sure_text
+from commands.consts import REMINDERS_ENABLED, TZ
+from commands.models import Game, get_game
+from core.expiry import game_dates
+from core.outbound import Priority
+
+REMINDER_TICK = 60
+# напоминание "завтра игра" и вопрос тем, кто под вопросом - накануне в это время
+DAY_BEFORE_AT = 12
+SOON_BEFORE = timedelta(hours=2)
+# сколько напоминаний отправлять одновременно, остальные ждут своей пачки, а не в очереди лимитера
+REMINDER_BATCH = 100
+
+# (когда, поколение игры, chat_id, message_id, вид напоминания)
+ReminderEntry = Tuple[datetime, int, int, int, str]
+
+
+def reminder_times(date: datetime) -> List[Tuple[datetime, str]]:
+    """Напоминания игры: накануне днем и, если указано время начала, за 2 часа"""
+    day_before = (date - timedelta(days=1)).replace(hour=DAY_BEFORE_AT, minute=0)
+    times = [(day_before, "day"), (day_before, "not_sure")]
+    if date.hour or date.minute:
+        times.append((date - SOON_BEFORE, "soon"))
+    return times
+
+
+class ReminderQueue:
+    """Одна мин-куча напоминаний на бота вместо задачи JobQueue на каждую игру.
+    У игры одно живое поколение: перенос - новое поколение (O(log n) на запись),
+    отмена - удаление поколения (O(1)), записи старых поколений выбрасываются при извлечении"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._heaps: Dict[int, List[ReminderEntry]] = {}
+        # (bot_id, chat_id, message_id) -> [поколение, сколько его записей еще в куче]
+        self._live: Dict[Tuple[int, int, int], List[int]] = {}
+        self._dead: Dict[int, int] = {}
+        self._generation = itertools.count(1)
+        self.sent = 0
+        self.stale = 0
+
+    def schedule(
+        self, bot_id: int, chat_id: int, message_id: int, date: datetime, now: Optional[datetime] = None
+    ) -> int:
+        """Запланировать (или перепланировать) напоминания игры, прошедшие пропускаются"""
+        if not self.enabled:
+            return 0
+        now = now or datetime.now(tz=TZ)
+        self.cancel(bot_id, chat_id, message_id)
+        generation = next(self._generation)
+        heap = self._heaps.setdefault(bot_id, [])
+        scheduled = 0
+        for fire_at, kind in reminder_times(date):
+            if fire_at > now:
+                heapq.heappush(heap, (fire_at, generation, chat_id, message_id, kind))
+                scheduled += 1
+        if scheduled:
+            self._live[(bot_id, chat_id, message_id)] = [generation, scheduled]
+        return scheduled
+
+    def cancel(self, bot_id: int, chat_id: int, message_id: int) -> None:
+        live = self._live.pop((bot_id, chat_id, message_id), None)
+        if live is None:
+            return
+        self._dead[bot_id] = self._dead.get(bot_id, 0) + live[1]
+        heap = self._heaps[bot_id]
+        if self._dead[bot_id] > max(len(heap) // 2, 64):
+            self._compact(bot_id)
+
+    def pop_due(self, bot_id: int, now: datetime) -> Iterator[ReminderEntry]:
+        heap = self._heaps.get(bot_id, [])
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            key = (bot_id, entry[2], entry[3])
+            live = self._live.get(key)
+            if live is None or live[0] != entry[1]:
+                self.stale += 1
+                self._dead[bot_id] -= 1
+                continue
+            live[1] -= 1
+            if not live[1]:
+                del self._live[key]
+            yield entry
+
+    def _compact(self, bot_id: int) -> None:
+        """Выбросить записи отмененных поколений, когда их стало больше половины кучи"""
+        heap = [
+            entry
+            for entry in self._heaps[bot_id]
+            if self._live.get((bot_id, entry[2], entry[3]), (None,))[0] == entry[1]
+        ]
+        heapq.heapify(heap)
+        self._heaps[bot_id] = heap
+        self._dead[bot_id] = 0
+
+    def __len__(self):
+        return sum(len(heap) for heap in self._heaps.values()) - sum(self._dead.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": len(self), "games": len(self._live), "sent": self.sent, "stale": self.stale}
+
+
+REMINDERS = ReminderQueue(enabled=REMINDERS_ENABLED)
+
+
+def index_reminders(application: Application) -> int:
+    """Восстановить напоминания по датам игр из базы, после рестарта задач не остается"""
+    now = datetime.now(tz=TZ)
+    return sum(
+        REMINDERS.schedule(application.bot.id, chat_id, message_id, date, now)
+        for chat_id, message_id, date in game_dates(application)
+    )
+
+
+def reminder_text(kind: str, game: Game, custom_names: dict) -> Optional[str]:
+    players = f"{min(len(game), game.max_players_count)}/{game.max_players_count}"
+    if kind == "day":
+        return f"Завтра игра! {game.date_text} {game.user_message}\nИгроков: {players}"
+    if kind == "soon":
+        return f"Через 2 часа игра! {game.date_text} {game.user_message}\nИгроков: {players}"
+    if kind == "not_sure" and any(user.type == "not_sure" for user in game.participants):
+        return not_sure_text(game, custom_names)
+    return None
+
+
+async def send_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отправить наступившие напоминания пачками по REMINDER_BATCH, темп задает OutboundLimiter"""
+    application = context.application
+    started = time.perf_counter()
+    due = []
+    for _, _, chat_id, message_id, kind in REMINDERS.pop_due(context.bot.id, datetime.now(tz=TZ)):
+        chat_data = application.chat_data[chat_id]
+        game = get_game(chat_data, message_id)
+        text = reminder_text(kind, game, chat_data.get("custom_names", {})) if game is not None else None
+        if text is None:
+            continue
+        due.append((chat_id, message_id, text))
+    if not due:
+        return
+
+    failed = 0
+    for start in range(0, len(due), REMINDER_BATCH):
+        results = await asyncio.gather(
+            *(
+                context.bot.send_message(
+                    chat_id=chat_id,
+                    reply_to_message_id=message_id,
+                    parse_mode=ParseMode.MARKDOWN,
+                    rate_limit_args=Priority.INFO,
+                    text=text,
+                )
+                for chat_id, message_id, text in due[start : start + REMINDER_BATCH]
+            ),
+            return_exceptions=True,
+        )
+        for error in results:
+            if isinstance(error, Exception):
+                failed += 1
+                logging.warning(f"Error while sending reminder - {error}")
+    REMINDERS.sent += len(due) - failed
+    logging.info(f"Reminders sent: {len(due) - failed}, failed: {failed}, in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import Callable, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+# (номер шарда, всего шардов) в процессе воркера, None - один процесс на все чаты
+CURRENT: Optional[Tuple[int, int]] = None
+
+STOP_TIMEOUT = 30
+
+
+def shard_of(chat_id: int, count: int) -> int:
+    return chat_id % count
+
+
+def owns(chat_id: int) -> bool:
+    """Чат обслуживается этим процессом"""
+    return CURRENT is None or shard_of(chat_id, CURRENT[1]) == CURRENT[0]
+
+
+def update_key(update: Update) -> int:
+    """Ключ шардирования: чат, для обновлений без чата - пользователь"""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+
+class ShardDispatcher:
+    """Раздает обновления воркерам по chat_id. У каждого чата один воркер и одна
+    очередь, поэтому порядок обновлений внутри чата сохраняется"""
+
+    def __init__(self, count: int, factory: Callable[[int, int], Application]):
+        self.count = count
+        self.factory = factory
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue() for _ in range(count)]
+        self.processes: List[multiprocessing.Process] = []
+        self.dispatched = [0] * count
+
+    def start(self) -> None:
+        for index, queue in enumerate(self.queues):
+            process = self._context.Process(
+                target=run_worker, args=(index, self.count, queue, self.factory), name=f"shard-{index}"
+            )
+            process.start()
+            self.processes.append(process)
+        logging.info(f"Started {self.count} shard workers")
+
+    def put(self, key: int, data: dict) -> None:
+        index = shard_of(key, self.count)
+        self.queues[index].put(data)
+        self.dispatched[index] += 1
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        self.put(update_key(update), update.to_dict())
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """Воркеры дорабатывают свои очереди и сохраняют данные, зависшие завершаются"""
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logging.warning(f"{process.name} did not stop in {timeout}s, terminating")
+                process.terminate()
+                process.join()
+        logging.info(f"Shard workers stopped, dispatched: {self.dispatched}")
+
+    def stats(self) -> dict:
+        return {
+            "dispatched": dict(enumerate(self.dispatched)),
+            "alive": sum(process.is_alive() for process in self.processes),
+        }
+
+
+def run_worker(index: int, count: int, queue, factory: Callable[[int, int], Application]) -> None:
+    global CURRENT
+    # Ctrl+C приходит всей группе процессов, останавливает воркеров только диспетчер
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    CURRENT = (index, count)
+    asyncio.run(serve_shard(factory(index, count), queue))
+
+
+async def serve_shard(application: Application, queue) -> None:
+    """Аналог run_polling для воркера: обновления берутся из очереди диспетчера"""
+    loop = asyncio.get_running_loop()
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, queue.get)
+                if data is None:
+                    break
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,33 @@
+"""Замеры холодного старта, включаются флагом --startup-profile.
+
+Импортируется в main.py первым, чтобы отсчет шел до импорта telegram.
+"""
+import logging
+import sys
+import time
+from typing import List, Tuple
+
+STARTED = time.perf_counter()
+ENABLED = "--startup-profile" in sys.argv
+MARKS: List[Tuple[str, float]] = []
+
+
+def mark(phase: str) -> None:
+    if ENABLED:
+        MARKS.append((phase, time.perf_counter()))
+
+
+def report() -> None:
+    previous = STARTED
+    for phase, moment in MARKS:
+        logging.info(
+            f"Startup {phase}: +{(moment - previous) * 1000:.1f} ms, total {(moment - STARTED) * 1000:.1f} ms"
+        )
+        previous = moment
+
+
+async def first_update(update, context) -> None:
+    """Последний хендлер: отметить первое обработанное обновление и напечатать отчет"""
+    if all(phase != "first update handled" for phase, _ in MARKS):
+        mark("first update handled")
+        report()
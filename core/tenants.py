@@ -0,0 +1,196 @@
+"""Несколько ботов в одном процессе: список ботов из BOTS_CONFIG, у каждого свои токен,
+разрешенные чаты, умолчания игр, часовой пояс, база и архив. Все Application
+работают в одном event loop и ходят в Bot API через общий пул соединений.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+from typing import Dict, List, Optional, Set
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from commands.consts import (
+    ARCHIVE_DIR,
+    BOT_TOKEN,
+    DB_PATH,
+    DEFAULTS,
+    GAME_HOUR,
+    GAME_PRICE,
+    MAX_PLAYERS_COUNT,
+    BotDefaults,
+)
+from core.access import ACCESS, AccessList, parse_chat_ids
+from core.archive import ARCHIVE, GameArchive
+
+NAME_RE = re.compile(r"[\w-]+")
+
+
+class BotSettings:
+    """Настройки и состояние одного бота, которое не должно смешиваться с другими"""
+
+    __slots__ = ("name", "token", "defaults", "access", "archive", "db_path")
+
+    def __init__(
+        self, name: str, token: str, defaults: BotDefaults, access: AccessList, archive: GameArchive, db_path: str
+    ):
+        self.name = name
+        self.token = token
+        self.defaults = defaults
+        self.access = access
+        self.archive = archive
+        self.db_path = db_path
+
+    @property
+    def bot_id(self) -> int:
+        # id бота - первая часть токена, getMe для этого не нужен
+        return int(self.token.split(":")[0])
+
+
+# один бот из env, как без BOTS_CONFIG
+DEFAULT = BotSettings("", BOT_TOKEN or "", DEFAULTS, ACCESS, ARCHIVE, DB_PATH)
+BOTS: Dict[int, BotSettings] = {}
+
+
+def settings_of(bot_id: int) -> BotSettings:
+    return BOTS.get(bot_id, DEFAULT)
+
+
+def register(settings: BotSettings) -> None:
+    BOTS[settings.bot_id] = settings
+
+
+def allowed_chat_ids(entry: dict) -> Set[int]:
+    allowed = entry.get("allowed_chat_ids", [])
+    if isinstance(allowed, str):
+        return parse_chat_ids(allowed)
+    return {int(chat_id) for chat_id in allowed}
+
+
+class ConfigAccessList(AccessList):
+    """Разрешенные чаты бота из BOTS_CONFIG, перечитываются при изменении файла,
+    как ALLOWED_CHAT_IDS из .env"""
+
+    def __init__(self, path: str, name: str, allowed: Set[int]):
+        super().__init__(env_path=path, allowed=allowed)
+        self.name = name
+
+    def _read_allowed(self) -> Optional[Set[int]]:
+        with open(self.env_path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries if isinstance(entries, list) else []:
+            if isinstance(entry, dict) and entry.get("name") == self.name:
+                return allowed_chat_ids(entry)
+        # бота убрали из файла - до перезапуска остается старый список
+        logging.warning(f"Bot {self.name} not found in {self.env_path}, keeping the old list")
+        return None
+
+
+def bot_settings(entry: dict, path: str = "") -> BotSettings:
+    """path - файл BOTS_CONFIG, из него список чатов перечитывается без перезапуска"""
+    name = str(entry.get("name", ""))
+    if not NAME_RE.fullmatch(name):
+        raise ValueError(f"Bad bot name {name!r}, use letters, digits, _ and -")
+    token = str(entry.get("token", ""))
+    if not re.fullmatch(r"\d+:\S+", token):
+        raise ValueError(f"Bad token for bot {name}")
+    allowed = allowed_chat_ids(entry)
+    try:
+        tz = ZoneInfo(entry.get("tz", DEFAULTS.tz.key))
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown tz {entry.get('tz')!r} for bot {name}")
+    defaults = BotDefaults(
+        price=int(entry.get("game_price", GAME_PRICE)),
+        hour=int(entry.get("game_hour", GAME_HOUR)),
+        max_players_count=int(entry.get("max_players_count", MAX_PLAYERS_COUNT)),
+        tz=tz,
+    )
+    return BotSettings(
+        name=name,
+        token=token,
+        defaults=defaults,
+        access=ConfigAccessList(path, name, allowed) if path else AccessList(allowed=allowed),
+        archive=GameArchive(entry.get("archive_dir") or os.path.join(ARCHIVE_DIR, name)),
+        db_path=entry.get("db_path") or os.path.join(os.path.dirname(DB_PATH), f"{name}.sqlite3"),
+    )
+
+
+def load_config(path: str) -> List[BotSettings]:
+    """JSON-список ботов, ошибка в любом - ValueError с именем бота"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} must be a non-empty JSON list of bots")
+
+    bots = [bot_settings(entry, path) for entry in entries]
+    for field in ("name", "bot_id", "db_path"):
+        values = [getattr(settings, field) for settings in bots]
+        duplicates = {value for value in values if values.count(value) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate {field} in {path}: {', '.join(map(str, duplicates))}")
+    return bots
+
+
+class SharedRequest(BaseRequest):
+    """Один пул соединений на всех ботов процесса. Каждый бот вызывает initialize и
+    shutdown у своего запроса, пул закрывается, когда его отпустил последний"""
+
+    def __init__(self, request: BaseRequest):
+        self.request = request
+        self.users = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.request.read_timeout
+
+    async def initialize(self) -> None:
+        self.users += 1
+        if self.users == 1:
+            await self.request.initialize()
+
+    async def shutdown(self) -> None:
+        self.users -= 1
+        if self.users == 0:
+            await self.request.shutdown()
+
+    async def do_request(self, *args, **kwargs):
+        return await self.request.do_request(*args, **kwargs)
+
+
+async def serve_bots(applications: List[Application]) -> None:
+    """Аналог run_polling для нескольких ботов: все в одном event loop до SIGINT/SIGTERM,
+    остановка в обратном порядке. Если бот не стартовал, уже запущенные останавливаются"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    running: List[Application] = []
+    try:
+        for application in applications:
+            await application.initialize()
+            running.append(application)
+            if application.post_init:
+                await application.post_init(application)
+            await application.updater.start_polling()
+            await application.start()
+            logging.info(f"Bot @{application.bot.username} started")
+        await stop.wait()
+    finally:
+        for application in reversed(running):
+            try:
+                if application.updater.running:
+                    await application.updater.stop()
+                if application.running:
+                    await application.stop()
+                    if application.post_stop:
+                        await application.post_stop(application)
+                await application.shutdown()
+                if application.post_shutdown:
+                    await application.post_shutdown(application)
+            except Exception as e:
+                logging.error(f"Error while stopping bot {application.bot.id} - {e}")
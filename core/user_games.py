@@ -0,0 +1,57 @@
+from typing import Dict, Set, Tuple
+
+from commands.models import Game, get_game, iter_games
+
+ChatKey = Tuple[int, int]
+
+
+class UserGamesIndex:
+    """Обратный индекс: id пользователя -> id сообщений игр чата, где он записан.
+    Чат индексируется из chat_data при первом обращении, дальше хендлеры обновляют
+    индекс после изменения списка. Записи удаленных игр вычищаются при чтении"""
+
+    def __init__(self):
+        self._chats: Dict[ChatKey, Dict[int, Set[int]]] = {}
+
+    def _chat(self, key: ChatKey, chat_data: dict) -> Dict[int, Set[int]]:
+        index = self._chats.get(key)
+        if index is None:
+            index = self._chats[key] = {}
+            for message_id, game in iter_games(chat_data):
+                for user_id in game.user_ids():
+                    index.setdefault(user_id, set()).add(message_id)
+        return index
+
+    def sync(self, bot_id: int, chat_id: int, chat_data: dict, message_id: int, user_id: int) -> None:
+        """Обновить запись пользователя после изменения списка игры"""
+        index = self._chat((bot_id, chat_id), chat_data)
+        game = get_game(chat_data, message_id)
+        if game is not None and game.has_user(user_id):
+            index.setdefault(user_id, set()).add(message_id)
+            return
+        message_ids = index.get(user_id)
+        if message_ids is not None:
+            message_ids.discard(message_id)
+            if not message_ids:
+                del index[user_id]
+
+    def games_of(self, bot_id: int, chat_id: int, chat_data: dict, user_id: int) -> Dict[int, Game]:
+        index = self._chat((bot_id, chat_id), chat_data)
+        games = {}
+        for message_id in list(index.get(user_id, ())):
+            game = get_game(chat_data, message_id)
+            if game is not None and game.has_user(user_id):
+                games[message_id] = game
+            else:
+                self.sync(bot_id, chat_id, chat_data, message_id, user_id)
+        return games
+
+    def forget(self, bot_id: int, chat_id: int) -> None:
+        """Чат выгружен из памяти, индекс построится заново при следующем обращении"""
+        self._chats.pop((bot_id, chat_id), None)
+
+    def __len__(self):
+        return len(self._chats)
+
+
+USER_GAMES = UserGamesIndex()
@@ -0,0 +1,121 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+from telegram import Update
+from telegram.ext import Application
+
+from core.http import HTTPServer, Request, Response
+
+
+class WebhookServer:
+    """Принимает обновления от Telegram и кладет их в очередь приложения"""
+
+    def __init__(
+        self,
+        application: Application,
+        listen: str,
+        port: int,
+        url_path: str,
+        secret_token: str = "",
+        max_connections: int = 40,
+    ):
+        self.application = application
+        self.secret_token = secret_token
+        self.http = HTTPServer(listen, port, max_connections=max_connections)
+        self.http.route("POST", url_path, self._handle_update)
+        self.http.route("GET", "/health", self._handle_health, capped=False)
+        self.ready = asyncio.Event()
+        self.received = 0
+        self.rejected = 0
+
+    async def _handle_update(self, request: Request) -> Response:
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get("x-telegram-bot-api-secret-token", ""), self.secret_token
+        ):
+            self.rejected += 1
+            return HTTPStatus.FORBIDDEN, b"", "text/plain"
+
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except Exception as e:
+            logging.warning(f"Bad webhook payload - {e}")
+            return HTTPStatus.BAD_REQUEST, b"", "text/plain"
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return HTTPStatus.OK, b"", "text/plain"
+
+    async def _handle_health(self, request: Request) -> Response:
+        body = json.dumps(
+            {
+                "status": "ok" if self.application.running else "starting",
+                "update_queue": self.application.update_queue.qsize(),
+                "received": self.received,
+                "rejected": self.rejected,
+                "connections": self.http.connections,
+                "timed_out": self.http.timed_out,
+            }
+        ).encode()
+        status = HTTPStatus.OK if self.application.running else HTTPStatus.SERVICE_UNAVAILABLE
+        return status, body, "application/json"
+
+
+async def serve_webhook(server: WebhookServer, webhook_url: str, stop_event: asyncio.Event) -> None:
+    """Аналог run_polling для вебхука: тот же порядок post_init/post_stop/post_shutdown"""
+    application = server.application
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=server.secret_token or None,
+            max_connections=server.http.max_connections,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await application.start()
+        await server.http.start()
+        server.ready.set()
+        try:
+            await stop_event.wait()
+        finally:
+            await server.http.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(
+    application: Application,
+    webhook_url: str,
+    listen: str = "0.0.0.0",
+    port: int = 8443,
+    secret_token: str = "",
+    max_connections: int = 40,
+) -> None:
+    server = WebhookServer(
+        application,
+        listen=listen,
+        port=port,
+        url_path=urlparse(webhook_url).path or "/",
+        secret_token=secret_token,
+        max_connections=max_connections,
+    )
+
+    async def main():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        await serve_webhook(server, webhook_url, stop_event)
+
+    asyncio.run(main())
@@ -0,0 +1,259 @@
+"""Выгрузка игр и участников в JSONL или CSV, вместо unpack.py.
+
+    python export.py chats_data.sqlite3 > games.jsonl
+    python export.py chats_data.dat --rows participants --format csv --chat -1001234 --since 2023-10-01
+    python export.py chats_data.sqlite3 --rows none --top 20
+
+Источник определяется по содержимому: SQLite база или старый файл PicklePersistence.
+Из базы игры читаются по одной и сразу пишутся в stdout, pickle по-другому прочитать
+нельзя - он загружается целиком, но один раз. Сводка (игры, участники, размер по чатам)
+печатается в stderr.
+"""
+import argparse
+import csv
+import json
+import os
+import pickle
+import sqlite3
+import sys
+from collections import Counter
+from datetime import date
+from typing import Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from commands.models import Game, iter_games
+from core.persistence import load_legacy_pickle, rows_to_game
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+GAME_FIELDS = (
+    "chat_id",
+    "message_id",
+    "date",
+    "user_message",
+    "author",
+    "price",
+    "hour",
+    "max_players_count",
+    "participants",
+    "players",
+    "not_sure",
+)
+PARTICIPANT_FIELDS = ("chat_id", "message_id", "position", "user_id", "name", "type")
+
+GameEntry = Tuple[int, int, Game]
+
+
+class Filters(NamedTuple):
+    chat_ids: Set[int]
+    since: Optional[date]
+    until: Optional[date]
+    author: Optional[int]
+
+    def matches(self, chat_id: int, game: Game) -> bool:
+        return (
+            (not self.chat_ids or chat_id in self.chat_ids)
+            and (self.since is None or game.date.date() >= self.since)
+            and (self.until is None or game.date.date() <= self.until)
+            and (self.author is None or game.author == self.author)
+        )
+
+
+class SQLiteSource:
+    """База SQLitePersistence, открывается только на чтение"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def _where(self, filters: Filters) -> Tuple[str, list]:
+        conditions, params = [], []
+        if filters.chat_ids:
+            conditions.append(f"g.chat_id IN ({', '.join('?' * len(filters.chat_ids))})")
+            params.extend(sorted(filters.chat_ids))
+        if filters.since:
+            conditions.append("substr(g.date, 1, 10) >= ?")
+            params.append(filters.since.isoformat())
+        if filters.until:
+            conditions.append("substr(g.date, 1, 10) <= ?")
+            params.append(filters.until.isoformat())
+        if filters.author is not None:
+            conditions.append("g.author = ?")
+            params.append(filters.author)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def games(self, filters: Filters) -> Iterator[GameEntry]:
+        """Игры и участники читаются двумя курсорами в одном порядке первичного ключа,
+        в памяти только текущая игра"""
+        where, params = self._where(filters)
+        games = self._conn.execute(
+            "SELECT g.chat_id, g.message_id, g.date, g.user_message, g.author, g.price, g.hour, "
+            f"g.max_players_count FROM games g {where} ORDER BY g.chat_id, g.message_id",
+            params,
+        )
+        participants = self._conn.cursor().execute(
+            "SELECT p.chat_id, p.message_id, p.position, p.user_id, p.username, p.type "
+            f"FROM participants p JOIN games g USING (chat_id, message_id) {where} "
+            "ORDER BY p.chat_id, p.message_id, p.position",
+            params,
+        )
+        pending = next(participants, None)
+        for chat_id, message_id, *game_row in games:
+            users = []
+            while pending is not None and pending[:2] == (chat_id, message_id):
+                users.append(pending[2:])
+                pending = next(participants, None)
+            yield chat_id, message_id, rows_to_game(tuple(game_row), users)
+
+    def chat_sizes(self, filters: Filters) -> Iterator[Tuple[int, int]]:
+        """Примерный объем данных чата в байтах: текст и blob как есть, числа по 8 байт"""
+        where, params = "", []
+        if filters.chat_ids:
+            where = f"WHERE chat_id IN ({', '.join('?' * len(filters.chat_ids))})"
+            params = sorted(filters.chat_ids)
+        yield from self._conn.execute(
+            "SELECT chat_id, SUM(bytes) FROM ("
+            "SELECT chat_id, length(CAST(date AS BLOB)) + length(CAST(user_message AS BLOB)) + 48 AS bytes "
+            "FROM games "
+            "UNION ALL SELECT chat_id, length(CAST(username AS BLOB)) + length(CAST(type AS BLOB)) + 32 "
+            "FROM participants "
+            "UNION ALL SELECT chat_id, length(CAST(name AS BLOB)) + 16 FROM custom_names "
+            "UNION ALL SELECT chat_id, length(key) + length(value) + 8 FROM chat_extra"
+            f") {where} GROUP BY chat_id",
+            params,
+        )
+
+
+class PickleSource:
+    """Файл PicklePersistence (chats_data.dat)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._chat_data = load_legacy_pickle(path).get("chat_data") or {}
+
+    def games(self, filters: Filters) -> Iterator[GameEntry]:
+        for chat_id in sorted(self._chat_data):
+            if filters.chat_ids and chat_id not in filters.chat_ids:
+                continue
+            for message_id, game in sorted(iter_games(self._chat_data[chat_id]), key=lambda item: item[0]):
+                if filters.matches(chat_id, game):
+                    yield chat_id, message_id, game
+
+    def chat_sizes(self, filters: Filters) -> Iterator[Tuple[int, int]]:
+        """Размер чата в pickle - длина его chat_data, сериализованной отдельно"""
+        for chat_id, chat_data in self._chat_data.items():
+            if not filters.chat_ids or chat_id in filters.chat_ids:
+                yield chat_id, len(pickle.dumps(chat_data, pickle.HIGHEST_PROTOCOL))
+
+
+def open_source(path: str):
+    with open(path, "rb") as f:
+        header = f.read(len(SQLITE_MAGIC))
+    return SQLiteSource(path) if header == SQLITE_MAGIC else PickleSource(path)
+
+
+def game_record(chat_id: int, message_id: int, game: Game) -> dict:
+    types = Counter(user.type for user in game.participants)
+    return {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "date": game.date.isoformat(),
+        "user_message": game.user_message,
+        "author": game.author,
+        "price": game.price,
+        "hour": game.hour,
+        "max_players_count": game.max_players_count,
+        "participants": len(game),
+        "players": types["i"] + types["i+1"],
+        "not_sure": types["not_sure"],
+    }
+
+
+def participant_records(chat_id: int, message_id: int, game: Game) -> Iterator[dict]:
+    for position, user in enumerate(game.participants):
+        yield {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "position": position,
+            "user_id": user.user_id,
+            "name": user.name,
+            "type": user.type,
+        }
+
+
+class Summary:
+    def __init__(self):
+        self.chats: Set[int] = set()
+        self.games = 0
+        self.types: Counter = Counter()
+
+    def add(self, chat_id: int, game: Game) -> None:
+        self.chats.add(chat_id)
+        self.games += 1
+        self.types.update(user.type for user in game.participants)
+
+    def lines(self, source, filters: Filters, top: int) -> List[str]:
+        sizes = sorted(source.chat_sizes(filters), key=lambda item: item[1], reverse=True)
+        total = sum(size for _, size in sizes)
+        lines = [
+            f"source: {source.path} ({type(source).__name__}, {os.path.getsize(source.path)} bytes on disk)",
+            f"chats with games: {len(self.chats)}",
+            f"games: {self.games}",
+            f"participants: {sum(self.types.values())} "
+            + " ".join(f"{user_type}={count}" for user_type, count in sorted(self.types.items())),
+            f"data by chat: {len(sizes)} chats, {total} bytes",
+        ]
+        for chat_id, size in sizes[:top]:
+            lines.append(f"  {chat_id}: {size} bytes ({size / total:.1%})")
+        return lines
+
+
+def export(source, filters: Filters, rows: str, output_format: str, out=sys.stdout) -> Summary:
+    fields = GAME_FIELDS if rows == "games" else PARTICIPANT_FIELDS
+    writer = None
+    if rows != "none" and output_format == "csv":
+        writer = csv.DictWriter(out, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+
+    summary = Summary()
+    for chat_id, message_id, game in source.games(filters):
+        summary.add(chat_id, game)
+        if rows == "none":
+            continue
+        if rows == "games":
+            records = (game_record(chat_id, message_id, game),)
+        else:
+            records = participant_records(chat_id, message_id, game)
+        for record in records:
+            if writer:
+                writer.writerow(record)
+            else:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path", nargs="?", default="chats_data.sqlite3", help="SQLite база или chats_data.dat")
+    parser.add_argument("--rows", choices=("games", "participants", "none"), default="games")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--chat", type=int, action="append", default=[], help="id чата, можно несколько раз")
+    parser.add_argument("--since", type=date.fromisoformat, help="игры с этой даты, YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, help="игры по эту дату включительно")
+    parser.add_argument("--author", type=int, help="id автора игры")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых больших чатов показать в сводке")
+    args = parser.parse_args()
+
+    source = open_source(args.path)
+    filters = Filters(set(args.chat), args.since, args.until, args.author)
+    try:
+        summary = export(source, filters, args.rows, args.format)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # вывод обрезали (| head), дописывать некуда
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    print("\n".join(summary.lines(source, filters, args.top)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
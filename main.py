@@ -1,47 +1,269 @@
+from core import startup  # первым: время старта считается от этого импорта
+
+import asyncio
 import logging
+import os
+import sys
+from typing import List, Optional
+
+from telegram import Update
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
-    PicklePersistence,
     CallbackQueryHandler,
+    TypeHandler,
 )
+from telegram.request import BaseRequest, HTTPXRequest
 from dotenv import load_dotenv
 
 from commands.command_delete import delete_schedule
-from commands.command_list import list_schedule
+from commands.command_edit import edit_schedule
+from commands.command_list import list_schedule, list_page
 from commands.command_new import new_schedule
 from commands.command_set_hour import set_hour
 from commands.command_set_max_players_count import set_max_players_count
 from commands.command_set_name import mynameis
 from commands.command_set_price import set_price
-from commands.common import buttons
-from commands.consts import ALLOWED_CHAT_IDS, BOT_TOKEN
+from commands.command_stats import stats
+from commands.common import buttons, EDITS
+from commands.consts import (
+    BOT_API_URL,
+    BOT_TOKEN,
+    BOTS_CONFIG,
+    CHAT_IDLE_SECONDS,
+    CONCURRENT_UPDATES,
+    DB_PATH,
+    EXPIRY_SWEEP_INTERVAL,
+    HTTP_POOL_SIZE,
+    LEGACY_PICKLE_PATH,
+    MAX_LOADED_CHATS,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    PERSISTENCE_UPDATE_INTERVAL,
+    RECORD_UPDATES,
+    REMINDERS_ENABLED,
+    SHARDS,
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from core.access import ACCESS, RELOAD_INTERVAL, AccessHandler, reload_access
+from core.chats import EVICT_INTERVAL, LazyChatsApplication, evict_chats
+from core.expiry import index_games, sweep_expired
+from core.inbound import CALLBACKS, CallbackGuardHandler
+from core.metrics import REGISTRY, InstrumentedRequest, MetricsServer, instrument_handlers
+from core.outbound import OVERALL_MAX_RATE, OutboundLimiter
+from core.persistence import SQLitePersistence, migrate_pickle
+from core.recorder import RECORDER, RecorderHandler, RecordingRequest, recording_path
+from core.reminders import REMINDER_TICK, REMINDERS, index_reminders, send_reminders
+from core import shards
+from core.tenants import DEFAULT, BotSettings, SharedRequest, load_config, register, serve_bots, settings_of
 
 load_dotenv()
+startup.mark("imports")
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
-PERSISTENCE = PicklePersistence(filepath="chats_data.dat", update_interval=10)
 
-if __name__ == "__main__":
-    logging.info(f"Allowed chats: {ALLOWED_CHAT_IDS}")
+METRICS = None
 
-    application = (
-        ApplicationBuilder()
-        .token(BOT_TOKEN)
-        .persistence(persistence=PERSISTENCE)
-        .build()
+
+async def post_init(application):
+    global METRICS
+    startup.mark("initialize")
+    logging.info(f"Games in expiry index: {index_games(application)}")
+    application.job_queue.run_repeating(sweep_expired, interval=EXPIRY_SWEEP_INTERVAL, first=0)
+    application.job_queue.run_repeating(
+        reload_access, interval=RELOAD_INTERVAL, data=settings_of(application.bot.id).access
     )
+    # сообщения самого бота в записи обезличиваются отдельно
+    RECORDER.bot_id = application.bot.id
+    if REMINDERS_ENABLED:
+        logging.info(f"Reminders scheduled: {index_reminders(application)}")
+        application.job_queue.run_repeating(send_reminders, interval=REMINDER_TICK)
+    if isinstance(application, LazyChatsApplication):
+        application.job_queue.run_repeating(evict_chats, interval=EVICT_INTERVAL)
+    if METRICS_PORT and METRICS is None:
+        # у каждого воркера свой порт: METRICS_PORT + номер шарда, при BOTS_CONFIG сервер один на процесс
+        port = METRICS_PORT + (shards.CURRENT[0] if shards.CURRENT else 0)
+        METRICS = MetricsServer(METRICS_LISTEN, port)
+        REGISTRY.register_stats("bot_edits", EDITS.stats)
+        REGISTRY.register_stats("bot_callbacks", CALLBACKS.stats)
+        if RECORDER.enabled:
+            REGISTRY.register_stats("bot_recorder", RECORDER.stats)
+        REGISTRY.register_stats("bot_reminders", REMINDERS.stats)
+        await METRICS.start()
+    if METRICS_PORT:
+        settings = settings_of(application.bot.id)
+        bot = settings.name or str(application.bot.id)
+        METRICS.watch(application, bot)
+        REGISTRY.register_stats("bot_access", settings.access.stats, {"bot": bot})
+    startup.mark("post_init")
+
+
+async def post_stop(application):
+    global METRICS
+    await EDITS.flush_all()
+    logging.info(f"Edit scheduler stats: {EDITS.stats()}")
+    if application.bot.rate_limiter:
+        logging.info(f"Outbound stats: {application.bot.rate_limiter.stats()}")
+    if RECORDER.enabled:
+        RECORDER.close()
+        logging.info(f"Recorded to {RECORDER.path}: {RECORDER.stats()}")
+    if METRICS:
+        await METRICS.stop()
+        METRICS = None
+
 
+def build_application(builder: ApplicationBuilder, settings: BotSettings = DEFAULT) -> Application:
+    """Собрать приложение с хендлерами бота, builder уже настроен (токен, хранилище, запросы)"""
+    application = builder.post_init(post_init).post_stop(post_stop).build()
+
+    # чужие чаты отсекаются до всех хендлеров, затем повторные и устаревшие нажатия
+    application.add_handler(AccessHandler(settings.access), group=-1)
+    if RECORDER.enabled:
+        # пишется до отсева повторов: при воспроизведении они снова отсеются
+        RECORDER.path = recording_path(RECORD_UPDATES, shards.CURRENT[0] if shards.CURRENT else None)
+        application.add_handler(RecorderHandler(RECORDER), group=-1)
+    application.add_handler(CallbackGuardHandler(CALLBACKS, application), group=-1)
+    application.add_handler(CallbackQueryHandler(list_page, pattern=r"^list:"))
     application.add_handler(CallbackQueryHandler(buttons))
     application.add_handler(CommandHandler("new", new_schedule))
     application.add_handler(CommandHandler("delete", delete_schedule))
+    application.add_handler(CommandHandler("edit", edit_schedule))
     application.add_handler(CommandHandler("list", list_schedule))
+    application.add_handler(CommandHandler("stats", stats))
     application.add_handler(CommandHandler("mynameis", mynameis))
     application.add_handler(CommandHandler("price", set_price))
     application.add_handler(CommandHandler("hour", set_hour))
     application.add_handler(CommandHandler("max_players_count", set_max_players_count))
+    if METRICS_PORT:
+        instrument_handlers(application)
+    if startup.ENABLED:
+        application.add_handler(TypeHandler(Update, startup.first_update), group=sys.maxsize)
+    return application
+
+
+def bot_builder(
+    shard_count: int = 1, settings: BotSettings = DEFAULT, request: Optional[BaseRequest] = None
+) -> ApplicationBuilder:
+    """ApplicationBuilder с настройками из env. При шардировании общий лимит Bot API делится между воркерами.
+    request - общий пул соединений нескольких ботов процесса"""
+    persistence = SQLitePersistence(
+        filepath=settings.db_path, update_interval=PERSISTENCE_UPDATE_INTERVAL, tz=settings.defaults.tz
+    )
+    builder = (
+        ApplicationBuilder()
+        .token(settings.token)
+        .persistence(persistence)
+        .application_class(
+            LazyChatsApplication, kwargs={"idle_seconds": CHAT_IDLE_SECONDS, "max_chats": MAX_LOADED_CHATS}
+        )
+        .rate_limiter(OutboundLimiter(overall_max_rate=OVERALL_MAX_RATE / shard_count))
+        .concurrent_updates(CONCURRENT_UPDATES or False)
+    )
+    if BOT_API_URL:
+        builder = builder.base_url(f"{BOT_API_URL}/bot")
+    if RECORDER.enabled:
+        request = RecordingRequest(request or HTTPXRequest(connection_pool_size=HTTP_POOL_SIZE), RECORDER)
+    if METRICS_PORT:
+        request = InstrumentedRequest(request or HTTPXRequest(connection_pool_size=HTTP_POOL_SIZE))
+    if request is not None:
+        builder = builder.request(request)
+    return builder
+
+
+def build_shard(index: int, count: int) -> Application:
+    """Воркер шарда: все хендлеры, обновления приходят от диспетчера"""
+    return build_application(bot_builder(shard_count=count).updater(None))
+
+
+def build_ingress(dispatcher: shards.ShardDispatcher) -> Application:
+    """Прием обновлений без хендлеров бота: только раздача воркерам"""
+
+    async def start_workers(application):
+        application.job_queue.run_repeating(reload_access, interval=RELOAD_INTERVAL)
+        dispatcher.start()
+
+    async def stop_workers(application):
+        await asyncio.get_running_loop().run_in_executor(None, dispatcher.stop)
+
+    builder = ApplicationBuilder().token(BOT_TOKEN).post_init(start_workers).post_stop(stop_workers)
+    if BOT_API_URL:
+        builder = builder.base_url(f"{BOT_API_URL}/bot")
+    if WEBHOOK_URL:
+        builder = builder.updater(None)
+    application = builder.build()
+    # обновления чужих чатов не доходят до воркеров
+    application.add_handler(AccessHandler(ACCESS), group=-1)
+    application.add_handler(TypeHandler(Update, dispatcher.dispatch))
+    return application
+
+
+def build_tenants(bots: List[BotSettings]) -> List[Application]:
+    """Все боты BOTS_CONFIG в одном процессе: общий пул соединений к Bot API,
+    у каждого свои база, архив, разрешенные чаты и умолчания игр"""
+    request = SharedRequest(HTTPXRequest(connection_pool_size=HTTP_POOL_SIZE))
+    applications = []
+    for settings in bots:
+        register(settings)
+        applications.append(build_application(bot_builder(settings=settings, request=request), settings))
+    return applications
+
+
+def run_tenants(config_path: str) -> None:
+    if SHARDS > 1 or WEBHOOK_URL:
+        raise SystemExit("BOTS_CONFIG works only with long polling, without SHARDS and WEBHOOK_URL")
+    if RECORDER.enabled:
+        logging.warning("RECORD_UPDATES is ignored with BOTS_CONFIG")
+        RECORDER.path = ""
+    bots = load_config(config_path)
+    for settings in bots:
+        logging.info(f"Bot {settings.name}: allowed chats {settings.access.allowed}, database {settings.db_path}")
+    applications = build_tenants(bots)
+    startup.mark("build")
+    asyncio.run(serve_bots(applications))
+
+
+if __name__ == "__main__":
+    if BOTS_CONFIG:
+        run_tenants(BOTS_CONFIG)
+        sys.exit()
+
+    logging.info(f"Allowed chats: {ACCESS.allowed}")
+    if not ACCESS.allowed:
+        logging.warning("ALLOWED_CHAT_IDS is empty, all chats will be rejected")
+
+    if not os.path.exists(DB_PATH) and os.path.exists(LEGACY_PICKLE_PATH):
+        chats = migrate_pickle(LEGACY_PICKLE_PATH, SQLitePersistence(filepath=DB_PATH))
+        logging.info(f"Migrated {chats} chats from {LEGACY_PICKLE_PATH}")
+    startup.mark("persistence")
+
+    if SHARDS > 1:
+        application = build_ingress(shards.ShardDispatcher(SHARDS, build_shard))
+    else:
+        builder = bot_builder()
+        if WEBHOOK_URL:
+            builder = builder.updater(None)
+        application = build_application(builder)
+    startup.mark("build")
+
+    if WEBHOOK_URL:
+        from core.webhook import run_webhook
 
-    application.run_polling()
+        logging.info(f"Starting webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT} for {WEBHOOK_URL}")
+        run_webhook(
+            application,
+            webhook_url=WEBHOOK_URL,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.run_polling()
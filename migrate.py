@@ -0,0 +1,16 @@
+import logging
+import sys
+
+from commands.consts import DB_PATH
+from core.persistence import SQLitePersistence, migrate_pickle
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+
+if __name__ == "__main__":
+    pickle_path = sys.argv[1] if len(sys.argv) > 1 else "chats_data.dat"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_PATH
+
+    chats = migrate_pickle(pickle_path, SQLitePersistence(filepath=db_path))
+    logging.info(f"Migrated {chats} chats from {pickle_path} to {db_path}")